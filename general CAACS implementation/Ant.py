@@ -1,6 +1,7 @@
 import math
 import random
 import sys
+import numpy as np
 from threading import *
 
 class Ant(Thread):
@@ -22,24 +23,22 @@ class Ant(Thread):
         self.Q0 = 0.5
         self.Rho = 0.99
 
-        # store the nodes remaining to be explored here
-        self.nodes_to_visit = {}
+        # feasible[i] stays True while node i can still be visited, i.e. while
+        # its cluster has not been visited yet (never for nodes in no cluster)
+        self.feasible = self.graph.cluster_of >= 0
 
-        for i in range(0, self.graph.num_nodes):
-            if i != self.start_node:
-                self.nodes_to_visit[i] = i
+        # store the clusters already explored here
+        self.cluster_visited = np.zeros(self.graph.num_clusters, dtype=bool)
+        self.clusters_left = self.graph.num_clusters
+        self.visit_cluster(self.graph.get_cluster(self.start_node))
 
-        # store the clusters remaining to be explored here
-        self.clusters_to_visit = {}
-        for i in range(len(self.graph.clusters_mat)):
-            if i != self.graph.get_cluster(self.start_node):
-                self.clusters_to_visit[i] = i
-
-        # create n X n matrix 0'd out to start
-        self.path_mat = []
-
-        for i in range(0, self.graph.num_nodes):
-            self.path_mat.append([0]*self.graph.num_nodes)
+    # marks a cluster as explored and removes all of its nodes from the candidates
+    def visit_cluster(self, c):
+        if c < 0 or self.cluster_visited[c]:
+            return
+        self.cluster_visited[c] = True
+        self.clusters_left -= 1
+        self.feasible[self.graph.get_members(c)] = False
 
     # overide Thread's run()
     def run(self):
@@ -51,7 +50,6 @@ class Ant(Thread):
             self.path_cost += graph.delta(self.curr_node, new_node)
 
             self.path_vec.append(new_node)
-            self.path_mat[self.curr_node][new_node] = 1  #adjacency matrix representing path
 
             print ("Ant %s : %s, %s" % (self.ID, self.path_vec, self.path_cost,))
             
@@ -67,11 +65,8 @@ class Ant(Thread):
         self.colony.update(self)
         print ("Ant thread %s terminating." % (self.ID,))
 
-        # allows thread to be restarted (calls Thread.__init__)
-        self.__init__(self.ID, self.start_node, self.colony)
-
     def end(self):
-        return not self.clusters_to_visit 
+        return self.clusters_left == 0
 
     # described in report -- determines next node to visit after curr_node
     def state_transition_rule(self, curr_node):
@@ -80,8 +75,14 @@ class Ant(Thread):
         max_node = -1
 
         # sanity check
-        if graph.get_cluster(curr_node) in self.clusters_to_visit.values():
-            del self.clusters_to_visit[graph.get_cluster(curr_node)]
+        self.visit_cluster(graph.get_cluster(curr_node))
+
+        if graph.vectorized:
+            max_node = self.vectorized_selection(curr_node, q)
+            self.visit_cluster(graph.get_cluster(max_node))
+            return max_node
+
+        candidates = np.flatnonzero(self.feasible).tolist()
 
         if q < self.Q0:
             # missing alpha parameter compared to standard ACO
@@ -89,13 +90,10 @@ class Ant(Thread):
             max_val = -1
             val = None
 
-            for node in self.nodes_to_visit.values():
+            for node in candidates:
                 if graph.tau(curr_node, node) == 0:
                     raise Exception("tau = 0")
                 
-                if graph.get_cluster(node) not in self.clusters_to_visit.values():
-                    continue
-                
                 # CHECK
                 val = graph.tau(curr_node, node) * math.pow(graph.etha(curr_node, node), self.Beta) * graph.scaled_emission(curr_node, node)
                 #val = graph.tau(curr_node, node) * math.pow(graph.etha(curr_node, node), self.Beta)
@@ -135,9 +133,7 @@ class Ant(Thread):
             nodes = []
             sum = 0.0
 
-            for node in self.nodes_to_visit.values():
-                if graph.get_cluster(node) not in self.clusters_to_visit:
-                    continue
+            for node in candidates:
                 tau = graph.tau(curr_node, node)
                 etha = graph.etha(curr_node, node)
                 if tau == 0:
@@ -165,14 +161,39 @@ class Ant(Thread):
         if max_node < 0:
             raise Exception("max_node < 0")
 
-        if max_node in self.nodes_to_visit.values():
-            del self.nodes_to_visit[max_node]
-
-        if graph.get_cluster(max_node) in self.clusters_to_visit.values():
-            del self.clusters_to_visit[graph.get_cluster(max_node)]
+        self.visit_cluster(graph.get_cluster(max_node))
         
         return max_node
 
+    # same rule as above but scoring the whole row of candidates at once,
+    # exploitation is a masked argmax and exploration a single cumulative-sum draw
+    def vectorized_selection(self, curr_node, q):
+        graph = self.colony.graph
+        candidates = np.flatnonzero(self.feasible)
+        if len(candidates) == 0:
+            raise Exception("max_node < 0")
+
+        tau_row = graph.tau_mat[curr_node, candidates]
+        if not tau_row.all():
+            raise Exception("tau = 0")
+        scores = tau_row * graph.attractiveness(self.Beta)[curr_node, candidates]
+
+        if q < self.Q0:
+            # argmax returns the first maximum, same tie-breaking as the loop version
+            return int(candidates[np.argmax(scores)])
+
+        cumulative = np.cumsum(scores)
+        total = cumulative[-1]
+        if total == 0:
+            return int(candidates[random.randrange(len(candidates))])
+        if np.isinf(total):
+            # zero-distance edges have infinite attractiveness, pick among those
+            best = candidates[np.isinf(scores)]
+            return int(best[random.randrange(len(best))])
+
+        index = np.searchsorted(cumulative, random.random() * total, side='right')
+        return int(candidates[min(index, len(candidates) - 1)])
+
     # phermone update rule for indiv ants
     def local_updating_rule(self, curr_node, next_node):
         graph = self.colony.graph
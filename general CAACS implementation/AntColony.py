@@ -1,15 +1,45 @@
 from Ant import Ant
 import random
-from threading import Lock, Condition
+from threading import Condition
 import sys
+import time
+from collections import namedtuple
+import numpy as np
+from Termination import default_termination
+from TourMetrics import tour_cost
+
+# passed to on_improvement whenever a colony finds a new best tour; elapsed is
+# in seconds since the colony's start_time
+Improvement = namedtuple('Improvement', ['path_vec', 'path_cost', 'carbon_cost', 'iteration', 'elapsed'])
 
 class AntColony:
-    def __init__(self, graph, num_ants, num_iterations):
+    def __init__(self, graph, num_ants, num_iterations, termination=None, on_improvement=None, seed_tours=None, local_search=None,
+                 cluster_optimization=None):
         self.graph = graph
         self.num_ants = num_ants
         self.num_iterations = num_iterations
         self.Alpha = 0.1
 
+        # stopping criteria, see Termination.py; num_iterations stays a hard cap
+        # per run, counted from the iteration a resumed run starts at
+        self.iteration_limit = num_iterations
+        if termination is None:
+            termination = default_termination(graph.num_nodes)
+        self.termination = termination
+        self.stop_reason = None
+
+        # called with an Improvement for every new best tour
+        self.on_improvement = on_improvement
+
+        # tours (e.g. yesterday's best) that deposit pheromone and become the
+        # starting best before the first iteration
+        self.seed_tours = [list(path_vec) for path_vec in seed_tours or []]
+
+        # optional LocalSearch run on the iteration's best tours and
+        # ClusterOptimizer run on them or on the final best, see improve_tours
+        self.local_search = local_search
+        self.cluster_optimization = cluster_optimization
+
         # condition var
         self.cv = Condition()
 
@@ -18,48 +48,117 @@ class AntColony:
     def reset(self):
         self.best_path_vec = None
         self.best_path_cost = sys.maxsize
-        self.best_path_mat  = None
         self.last_best_path_iteration = 0
+        self.start_time = time.time()
+
+    # keeps a new best tour and reports it to on_improvement
+    def record_best(self, path_vec, path_cost):
+        self.best_path_cost = path_cost
+        self.best_path_vec = path_vec
+        self.last_best_path_iteration = self.iter_counter
+
+        if self.on_improvement is not None:
+            c_cost = self.graph.carbon_cost(path_vec, self.graph.carbon_mat)
+            self.on_improvement(Improvement(list(path_vec), path_cost, c_cost, self.iter_counter, time.time() - self.start_time))
 
-    def start(self):
+    # deposit along a tour with the global update's rule (evaporation
+    # restricted to the tour's edges), used for seed tours and migrants
+    def deposit_tour(self, path_vec, path_cost):
+        graph = self.graph
+        r, s = tour_edges(path_vec)
+        if graph.vectorized:
+            graph.tau_mat[r, s] = (1 - self.Alpha) * graph.tau_mat[r, s] + self.Alpha / path_cost * graph.scaled_mat[r, s]
+            return
+
+        for i, j in zip(r.tolist(), s.tolist()):
+            graph.update_tau(i, j, (1 - self.Alpha) * graph.tau(i, j) + self.Alpha / path_cost * graph.scaled_emission(i, j))
+
+    # called once the run's state is reset, before the first iteration; a seed
+    # tour that no longer visits every cluster once (the network changed since
+    # it was found) is repaired like the best tour after an incremental change
+    def plant_seed_tours(self):
+        from Incremental import repair_tour
+
+        graph = self.graph
+        for path_vec in self.seed_tours:
+            nodes = [int(node) for node in path_vec if 0 <= node < graph.num_nodes]
+            clusters = set(graph.get_cluster(node) for node in nodes)
+            if len(nodes) != len(path_vec) or len(nodes) != graph.num_clusters or len(clusters) != graph.num_clusters or -1 in clusters:
+                print ("seed tour does not visit every cluster once, repaired")
+                path_vec = repair_tour(graph, nodes)
+
+            path_cost = tour_cost(graph.delta_mat, path_vec)
+            self.deposit_tour(path_vec, path_cost)
+            if path_cost < self.best_path_cost:
+                self.record_best(list(path_vec), path_cost)
+
+    # resume continues a finished or interrupted run (e.g. after a change made
+    # through Incremental.py) with its best tour and pheromone, for
+    # extra_iterations (default num_iterations) more iterations
+    def start(self, start_time=None, resume=False, extra_iterations=None):
+        if not resume:
+            self.reset()
+            self.iter_counter = 0
         self.ants = self.create_ants()
-        self.iter_counter = 0
-        best_path_cost = self.best_path_cost
-        no_change_count = 0
+        self.begin_termination(start_time, extra_iterations)
+        if not resume:
+            self.plant_seed_tours()
 
-        while self.iter_counter < self.num_iterations:
+        while self.iter_counter < self.iteration_limit:
             self.iteration()
             self.cv.acquire()
-            # wait until update calls notify
-            self.cv.wait()
+            # wait until update calls notify, the predicate guards against the
+            # notify arriving before we started waiting
+            self.cv.wait_for(lambda: self.ant_counter == len(self.ants))
 
             lock = self.graph.lock
             lock.acquire()
             #self.graph.create_image(str(self.iter_counter), self.best_path_vec, self.best_path_cost)
+            self.improve_tours(self.iteration_paths, self.iteration_costs)
             self.global_updating_rule()
-
-            if self.best_path_cost < best_path_cost:
-                best_path_cost = self.best_path_cost
-                no_change_count = 0
-            else:
-                no_change_count += 1
+            stop = self.check_termination()
 
             #print(self.best_path_vec)
             #print(self.best_path_cost)
 
             lock.release()
             self.cv.release()
-            # stopping criteria, comment out if no termination criteria
-            if (no_change_count == self.graph.num_nodes/5):
+            if stop:
                 break
+        self.finish_tours()
+
+    # start_time defaults to now, a caller with a deadline passes the time its
+    # clock started so that TimeBudget and Improvement.elapsed count from there
+    def begin_termination(self, start_time=None, extra_iterations=None):
+        self.start_time = time.time() if start_time is None else start_time
+        self.iteration_limit = self.iter_counter + (self.num_iterations if extra_iterations is None else extra_iterations)
+        # a run with no iteration left to do stops right away
+        self.stop_reason = None if self.iter_counter < self.iteration_limit else self.limit_reason()
+        if self.termination is not None:
+            self.termination.reset(self)
+
+    # called after every global update, records why the run stops
+    def check_termination(self):
+        if self.termination is not None:
+            self.stop_reason = self.termination.check(self)
+        if self.stop_reason is None and self.iter_counter >= self.iteration_limit:
+            self.stop_reason = self.limit_reason()
+        return self.stop_reason is not None
+
+    def limit_reason(self):
+        return "iteration limit of %s reached" % (self.iteration_limit,)
 
     # one iteration involves spawning a number of ant threads
     def iteration(self):
     
         self.ant_counter = 0
         self.avg_path_cost = 0
+        self.iteration_paths = []
+        self.iteration_costs = []
         self.iter_counter += 1
         #print ("iter_counter = %s" % (self.iter_counter,))
+        # fresh thread objects each iteration, a finished thread cannot be restarted
+        self.ants = [Ant(ant.ID, ant.start_node, self) for ant in self.ants]
         for ant in self.ants:
             print ("starting ant = %s" % (ant.ID))
             ant.start()
@@ -75,56 +174,117 @@ class AntColony:
 
     # called by individual ants
     def update(self, ant):
-        lock = Lock()
+        lock = self.cv
         lock.acquire()
 
         print ("Update called by %s" % (ant.ID,))
         self.ant_counter += 1
 
         self.avg_path_cost += ant.path_cost
+        self.iteration_paths.append(ant.path_vec)
+        self.iteration_costs.append(ant.path_cost)
 
         # book-keeping
         if ant.path_cost < self.best_path_cost:
-            self.best_path_cost = ant.path_cost
-            self.best_path_mat = ant.path_mat
-            self.best_path_vec = ant.path_vec
-            self.last_best_path_iteration = self.iter_counter
+            self.record_best(ant.path_vec, ant.path_cost)
 
         if self.ant_counter == len(self.ants):
             self.avg_path_cost /= len(self.ants)
             #print ("Best: %s, %s, %s, %s" % (self.best_path_vec, self.best_path_cost, self.iter_counter, self.avg_path_cost,))
             #outfile.write("\n%s\t%s\t%s" % (self.iter_counter, self.avg_path_cost, self.best_path_cost,))
-            self.cv.acquire()
             self.cv.notify()
-            self.cv.release()
         #outfile.close()
         lock.release()
 
     def done(self):
-        return self.iter_counter == self.num_iterations
+        return self.iter_counter == self.iteration_limit
+
+    # improvement stages on the top_k tours of the iteration, before the
+    # global update so that an improved tour can become the best path it
+    # deposits on
+    def improve_tours(self, paths, costs):
+        stages = [stage for stage in (self.local_search, self.cluster_optimization) if stage is not None]
+        if self.cluster_optimization is not None and not self.cluster_optimization.every_iteration:
+            stages.remove(self.cluster_optimization)
+        if not stages:
+            return
+        # each stage takes its own top_k tours, a tour picked by several stages
+        # goes through them in order
+        order = np.argsort(costs, kind='stable')
+        improved = {}
+        for stage in stages:
+            for k in order[:stage.top_k]:
+                path_vec = improved[k][0] if k in improved else paths[k]
+                improved[k] = (stage.improve(self.graph, path_vec), stage)
+        for path_vec, stage in improved.values():
+            self.offer_improved(path_vec, stage)
+
+    def improve_tour(self, path_vec, stages):
+        for stage in stages:
+            path_vec = stage.improve(self.graph, path_vec)
+        self.offer_improved(path_vec, stage)
+
+    # a stage never makes a tour worse on its objective, and the improved tour
+    # replaces the best when it beats it on the objective of the last stage
+    # that ran on it (cost plus weighted carbon); the colony's recorded cost
+    # stays the distance
+    def offer_improved(self, path_vec, stage):
+        if self.best_path_vec is None or stage.objective(path_vec) < stage.objective(self.best_path_vec):
+            self.record_best(path_vec, tour_cost(self.graph.delta_mat, path_vec))
 
-    # assign each ant a random start-node
+    # called once the run stops, cluster optimization of the final best tour
+    def finish_tours(self):
+        stage = self.cluster_optimization
+        if stage is not None and not stage.every_iteration and self.best_path_vec is not None:
+            self.improve_tour(self.best_path_vec, [stage])
+
+    # assign each ant a random start-node, nodes outside every cluster are skipped
     def create_ants(self):
-        self.reset()
         ants = []
+        members = self.graph.cluster_members
         for i in range(0, self.num_ants):
-            ant = Ant(i, random.randint(0, self.graph.num_nodes - 1), self)
+            ant = Ant(i, int(members[random.randrange(len(members))]), self)
             ants.append(ant)
         
         return ants
 
-    # changes the tau matrix based on evaporation/deposition 
+    # changes the tau matrix based on evaporation/deposition
+    # evaporation scales every off-diagonal cell, deposition only touches the
+    # edges of the best path (the only cells with a non-zero delta tau)
     def global_updating_rule(self):
-        evaporation = 0
-        deposition = 0
-
-        for r in range(0, self.graph.num_nodes):
-            for s in range(0, self.graph.num_nodes):
-                if r != s:
-                    delt_tau = self.best_path_mat[r][s] / self.best_path_cost
-                    evaporation = (1 - self.Alpha) * self.graph.tau(r, s)
-                    # check
-                    deposition = self.Alpha * delt_tau * self.graph.scaled_emission(r, s)
-                    #deposition = self.Alpha * delt_tau
-
-                    self.graph.update_tau(r, s, evaporation + deposition)
\ No newline at end of file
+        graph = self.graph
+        evaporation = 1 - self.Alpha
+        deposition = self.Alpha / self.best_path_cost
+        r, s = self.best_path_edges()
+
+        if graph.vectorized:
+            tau = graph.tau_mat
+            diagonal = np.arange(graph.num_nodes)
+            diagonal_tau = tau[diagonal, diagonal]
+            tau *= evaporation
+            tau[diagonal, diagonal] = diagonal_tau
+            # check
+            tau[r, s] += deposition * graph.scaled_mat[r, s]
+            #tau[r, s] += deposition
+            return
+
+        for i in range(0, graph.num_nodes):
+            row = graph.tau_mat[i]
+            for j in range(0, graph.num_nodes):
+                if i != j:
+                    row[j] = evaporation * row[j]
+
+        for i, j in zip(r.tolist(), s.tolist()):
+            # check
+            graph.update_tau(i, j, graph.tau(i, j) + deposition * graph.scaled_emission(i, j))
+            #graph.update_tau(i, j, graph.tau(i, j) + deposition)
+
+    # edges (r, s) of the best path, derived from consecutive pairs of
+    # best_path_vec; like the old path_mat bookkeeping this leaves out the
+    # closing edge back to the start node
+    def best_path_edges(self):
+        return tour_edges(self.best_path_vec)
+
+def tour_edges(path_vec):
+    path = np.asarray(path_vec, dtype=np.int64)
+    return path[:-1], path[1:]
@@ -1,98 +1,21 @@
 import sys
-import math
 import random
 from AntColony import AntColony
+from BatchAntColony import BatchAntColony
+from GTSPInstance import load_instance, CACHE_DIR
+from Termination import TimeBudget, AnyOf
+from PheromoneState import load_state, save_state, save_colony_state
 from AntGraph import AntGraph
+from PackedMatrix import PackedSymmetric
+from CarbonEmission import build_emission_matrices
+import numpy as np
 import os
 import time
 
-# define constants for LDV, MDV and HDV
-# assume the LDV constants
-fuel_to_air = (1, 1, 1)
-gravitational_constant = (9.81, 9.81, 9.81)
-air_density = (1.2041, 1.2041, 1.2041)
-coef_rolling = (0.01, 0.01, 0.01)
-diesel_engine_efficiency = (0.45, 0.45, 0.45)
-heating_value_diesel = (44, 44, 44)
-vehicle_speed = (22.2, 22.2, 22.2)
-conversion_factor = (737, 737, 737)
-road_angle = (0, 0, 0)
-kerb_weight = (3500, 5500, 13154)
-max_payload = (4000, 12500, 17236)
-engine_friction_factor = (0.25, 0.20, 0.15)
-engine_speed = (38.3, 36.7, 30.2)
-engine_displacement = (4.50, 6.90, 6.66)
-aero_drag = (0.6, 0.7, 0.7)
-frontal_SA = (7.0, 8.0, 9.8)
-vehicle_drive_eff = (0.45, 0.45, 0.50)
-u = 2.63
-# supposedly nonconstant stuff
-speed_ij = (38, 38, 38) # randomly select from 11 to 38
-# weight carried by the car
-F_ijkpt = (200, 300, 400)
 scalar = 60
 
-def create_carbon_emission(distance): #0, 1, 2 for vehicle type
-    # Generate a random integer from the set {0, 1, 2}
-    vehicle_type = 1
-    
-    # extra constant stuff
-    lambda_s = fuel_to_air[vehicle_type]/(heating_value_diesel[vehicle_type]*conversion_factor[vehicle_type])
-    s = gravitational_constant[vehicle_type] * (math.sin(road_angle[vehicle_type]) + coef_rolling[vehicle_type]*math.cos(road_angle[vehicle_type]))
-    gamma_k = 1/(1000*diesel_engine_efficiency[vehicle_type]*vehicle_drive_eff[vehicle_type])
-    beta_k = 0.5*aero_drag[vehicle_type]*air_density[vehicle_type]*frontal_SA[vehicle_type]
-    y_k = engine_friction_factor[vehicle_type] * engine_speed[vehicle_type] * engine_displacement[vehicle_type]
-
-    new_speed_ij = random.randint(11, 38)
-    engine_module = (lambda_s * y_k * distance)/new_speed_ij
-    speed_module = lambda_s*gamma_k*beta_k*distance*(speed_ij[vehicle_type]**2)
-    weight_module = lambda_s * gamma_k * s * distance * (kerb_weight[vehicle_type] + F_ijkpt[vehicle_type])
-
-    carbon_emission = (engine_module + speed_module + weight_module) * u
-
-    return (carbon_emission)
-
-def get_sum(mat):
-    sum = 0
-    for i in range(len(mat)):
-        row = mat[i]
-        for j in range(len(row)):
-            sum += row[j]
-    return sum
-
-def get_max(mat):
-    num_row = len(mat)
-    num_col = len(mat[0])
-    max_num = -1e9
-    for i in range(num_row):
-        for j in range(num_col):
-            if mat[i][j] > max_num:
-                max_num = mat[i][j]
-    return max_num
-
-def solve(file_path, input_file):
-    f = open(file_path+input_file, 'r', encoding='iso-8859-1')
-
-    nodes_temp = f.readline().strip().split()
-    num_nodes = int(nodes_temp[1])
-
-    clusters_temp = f.readline().strip().split()
-    num_clusters = int(clusters_temp[1])
-
-    # skip the symmetric amd triangle for now
-    f.readline()
-    f.readline()
-
-    clusters_mat = []
-    for i in range(num_clusters):
-        clusters_list = f.readline().strip().split()
-        clusters_num_list = []
-        for j, val in enumerate(clusters_list):
-            if j != 0:
-                clusters_num_list.append(int(val)-1) # reindex 1-n to 0-(n-1)
-        clusters_mat.append(clusters_num_list)
-    #print(clusters_mat)
-
+# colony size, iteration cap and repetitions used for an instance of num_nodes
+def default_parameters(num_nodes):
     if num_nodes <= 10:
         num_ants = 20
         num_iterations = 1000
@@ -105,74 +28,112 @@ def solve(file_path, input_file):
         # we should set a termination critera if the optimal path doesn't change after 15 iteration
         num_iterations = 1000 
         num_repetitions = 1
-    
-    cities = [str(i) for i in range(num_nodes)]
-    #print(cities)
-
-    cost_mat = []
-    carbon_mat = []
-    while True:
-        line = f.readline().strip()
-        if not line:
-            break
-        row = line.strip().split()
-        number_row = []
-        carbon_row = []
-        for num_str in row:
-            number = int(num_str)
-            number_row.append(number)
-            carbon_val = create_carbon_emission(number)
-            carbon_row.append(carbon_val)
-        cost_mat.append(number_row)
-        carbon_mat.append(carbon_row)
-    f.close()
-
-    if num_nodes < len(cost_mat):
-        cost_mat = cost_mat[0:num_nodes]
-        for i in range(0, num_nodes):
-            cost_mat[i] = cost_mat[i][0:num_nodes]
-
-    #print (cost_mat)
-    #print()
-
-    if num_nodes < len(carbon_mat):
-        carbon_mat = carbon_mat[0:num_nodes]
-        for i in range(0, num_nodes):
-            carbon_mat[i] = carbon_mat[i][0:num_nodes]
-
-    #print (carbon_mat)
-    #print()
-
-    # recreate cost_mat to corporate carbon_mat
-    # cost_sum = get_sum(cost_mat)
-    # carbon_sum = get_sum(carbon_mat)
-    scaled_mat = []
-    max_carbon = get_max(carbon_mat)
-    for i in range(len(carbon_mat)):
-        carbon_row = carbon_mat[i]
-        scaled_row = []
-        for j in range(len(carbon_row)):
-            scaled_num = scalar**(1 - carbon_mat[i][j]/max_carbon)
-            scaled_row.append(scaled_num)
-        scaled_mat.append(scaled_row)
-    #print(scaled_mat)
-            
+    return num_ants, num_iterations, num_repetitions
+
+# graph for one instance file with the carbon and scaled matrices of one
+# vehicle class, the per-edge speeds drawn from a generator seeded by seed;
+# tau_mat (e.g. from a saved PheromoneState) replaces the uniform initial tau;
+# a tau_mat of another node count (a network that changed since) is dropped.
+# symmetric stores every matrix once per node pair (one speed per pair) for
+# instances whose header says Symmetric: true and whose distances agree.
+# dtype and delta_dtype are the storage precisions of the vectorized graph
+# (e.g. float32 and 'auto' for compact matrices), see AntGraph. An in-memory
+# instance (e.g. from CoordinateInstance.py) is used instead of the file.
+def build_graph(file_path, input_file, vectorized=False, seed=None, cache_dir=CACHE_DIR, vehicle_type=1, positions=None, tau_mat=None,
+                symmetric=False, dtype=np.float64, delta_dtype=None, instance=None):
+    # parsed once per instance content, later runs memory-map the binary cache
+    if instance is None:
+        instance = load_instance(file_path + input_file, cache_dir)
+    if positions is None:
+        positions = instance.positions
+    num_nodes = instance.num_nodes
+    num_ants, num_iterations, num_repetitions = default_parameters(num_nodes)
+    if tau_mat is not None and len(tau_mat) != num_nodes:
+        print ("pheromone state has %s nodes, %s has %s: starting from tau0" % (len(tau_mat), instance.name, num_nodes))
+        tau_mat = None
+
+    cost_mat = instance.delta_mat
+    if symmetric and not (instance.symmetric and np.array_equal(cost_mat, cost_mat.T)):
+        print ("%s is not symmetric, using full matrices" % (instance.name,))
+        symmetric = False
+
+    if symmetric:
+        cost_mat = PackedSymmetric.from_matrix(cost_mat, np.float64)
+        carbon_data, scaled_data = build_emission_matrices(cost_mat.data, np.random.default_rng(seed), scalar, vehicle_types=(vehicle_type,))
+        carbon_mat = PackedSymmetric(num_nodes, carbon_data[0])
+        scaled_mat = PackedSymmetric(num_nodes, scaled_data[0])
+    else:
+        carbon_mats, scaled_mats = build_emission_matrices(cost_mat, np.random.default_rng(seed), scalar, vehicle_types=(vehicle_type,))
+        carbon_mat = carbon_mats[0]
+        scaled_mat = scaled_mats[0]
+
+    return AntGraph(instance.name, num_ants, num_nodes, cost_mat, carbon_mat, scaled_mat, instance.clusters_mat,
+                    tau_mat=tau_mat, vectorized=vectorized or symmetric, positions=positions, symmetric=symmetric, dtype=dtype,
+                    delta_dtype=delta_dtype)
+
+# warm start: the pheromone matrix of a saved state and its best tour, which is
+# planted as a seed tour alongside any given ones. The pheromone is only used
+# for the same node set (see build_graph), the tour is repaired to the current
+# clusters (see AntColony.plant_seed_tours)
+def warm_start_parameters(warm_start, seed_tours):
+    seed_tours = list(seed_tours or [])
+    if warm_start is None:
+        return None, seed_tours
+    state = load_state(warm_start)
+    return state.tau_mat, [state.best_path_vec] + seed_tours
+
+# engine is either 'threaded' (one Ant thread per ant) or 'batch' (lockstep
+# BatchAntColony, which always uses a vectorized graph). warm_start is the path
+# of a state saved through state_path by an earlier run, seed_tours are extra
+# tours planted before the first iteration. symmetric selects the packed
+# storage of build_graph (and implies vectorized). With instance the file
+# arguments are not used. local_search is a LocalSearch (see LocalSearch.py)
+# run on the best tours of every iteration, cluster_optimization a
+# ClusterOptimizer (see ClusterOptimization.py). Errors are printed and None is
+# returned unless raise_errors is set.
+def solve(file_path, input_file, vectorized=False, engine='threaded', seed=None, cache_dir=CACHE_DIR, vehicle_type=1,
+          create_images=True, positions=None, termination=None, on_improvement=None, warm_start=None, seed_tours=None,
+          state_path=None, symmetric=False, dtype=np.float64, delta_dtype=None, instance=None, local_search=None,
+          cluster_optimization=None, raise_errors=False):
+    if seed is not None:
+        random.seed(seed)
+    if engine == 'batch':
+        vectorized = True
 
     try:
-        graph = AntGraph(input_file[:-4], num_ants, num_nodes, cost_mat, carbon_mat, scaled_mat, clusters_mat)
+        tau_mat, seed_tours = warm_start_parameters(warm_start, seed_tours)
+        graph = build_graph(file_path, input_file, vectorized, seed, cache_dir, vehicle_type, positions, tau_mat, symmetric, dtype, delta_dtype,
+                            instance)
+        num_ants, num_iterations, num_repetitions = default_parameters(graph.num_nodes)
+        print ("Graph memory = %.2f MB" % (graph.memory_footprint()['total'] / 1e6,))
+        cities = [str(i) for i in range(graph.num_nodes)]
+
         best_path_cost = sys.maxsize
         best_path_vec = None
         iter_counter = 1000
-        graph.create_image('None', None, None)
+        # the cluster picture is the only thing that needs a node layout
+        if create_images:
+            graph.create_image('None', None, None)
         for i in range(0, num_repetitions):
             graph.reset_tau()
-            ant_colony = AntColony(graph, num_ants, num_iterations)
+            if engine == 'batch':
+                ant_colony = BatchAntColony(graph, num_ants, num_iterations, seed=None if seed is None else seed + i, termination=termination,
+                                            on_improvement=on_improvement, seed_tours=seed_tours, local_search=local_search,
+                                            cluster_optimization=cluster_optimization)
+            else:
+                ant_colony = AntColony(graph, num_ants, num_iterations, termination=termination, on_improvement=on_improvement,
+                                       seed_tours=seed_tours, local_search=local_search, cluster_optimization=cluster_optimization)
             ant_colony.start()
             if ant_colony.best_path_cost < best_path_cost:
                 best_path_cost = ant_colony.best_path_cost
                 best_path_vec = ant_colony.best_path_vec
                 iter_counter = ant_colony.iter_counter
-                c_cost = graph.carbon_cost(best_path_vec, carbon_mat)
+                stop_reason = ant_colony.stop_reason
+                c_cost = graph.carbon_cost(best_path_vec, graph.carbon_mat)
+                best_tau = np.array(graph.tau_mat, dtype=np.float32) if state_path is not None else None
+
+        if state_path is not None:
+            save_state(state_path, graph.instance_name, best_tau, best_path_vec, best_path_cost)
 
         print ("\n**************************************************************")
         print ("*                   Final Results                            *")
@@ -182,12 +143,69 @@ def solve(file_path, input_file):
             print (cities[node] + " ",)
         print ("\nBest path cost = %s\n" % (best_path_cost,))
         print ("\nBest path carbon cost = %s\n" % (c_cost,))
+        print ("\nStopped after %s iterations: %s\n" % (iter_counter, stop_reason))
         #graph.create_image('F', best_path_vec, best_path_cost)
         return best_path_vec, best_path_cost, c_cost, iter_counter
     
     except Exception as e:
+        if raise_errors:
+            raise
         print ("exception: " + str(e))
 
+# Anytime solving: deadline is a wall-clock budget in seconds counted from the
+# call (instance loading included). The colony is checked after every
+# iteration, so a run ends at most one iteration after the deadline, and it
+# always completes at least one iteration so that there is a tour to return.
+# termination can add rules that stop earlier (e.g. Stagnation or TargetCost).
+
+# generator yielding an Improvement (see AntColony.py) for every new best tour
+# while the lockstep colony runs; its return value is the number of iterations
+def iter_improvements(file_path, input_file, deadline, seed=None, cache_dir=CACHE_DIR, vehicle_type=1, num_iterations=None,
+                      termination=None, positions=None, warm_start=None, seed_tours=None, state_path=None, symmetric=False,
+                      dtype=np.float64, delta_dtype=None, instance=None, local_search=None, cluster_optimization=None):
+    start_time = time.time()
+    tau_mat, seed_tours = warm_start_parameters(warm_start, seed_tours)
+    graph = build_graph(file_path, input_file, True, seed, cache_dir, vehicle_type, positions, tau_mat, symmetric, dtype, delta_dtype,
+                        instance)
+    num_ants, default_iterations, num_repetitions = default_parameters(graph.num_nodes)
+    if num_iterations is None:
+        num_iterations = default_iterations
+    graph.reset_tau()
+
+    rules = TimeBudget(deadline) if termination is None else AnyOf(TimeBudget(deadline), termination)
+    improvements = []
+    ant_colony = BatchAntColony(graph, num_ants, num_iterations, seed=seed, termination=rules, on_improvement=improvements.append,
+                                seed_tours=seed_tours, local_search=local_search, cluster_optimization=cluster_optimization)
+    for iter_counter in ant_colony.run(start_time):
+        for improvement in improvements:
+            yield improvement
+        del improvements[:]
+    # a final cluster optimization improves after the last iteration
+    for improvement in improvements:
+        yield improvement
+
+    if state_path is not None:
+        save_colony_state(state_path, ant_colony)
+    return ant_colony.iter_counter
+
+# same return value as solve, every new best is passed to callback while running
+def solve_anytime(file_path, input_file, deadline, callback=None, **kwargs):
+    best = None
+    improvements = iter_improvements(file_path, input_file, deadline, **kwargs)
+    while True:
+        try:
+            improvement = next(improvements)
+        except StopIteration as stop:
+            iter_counter = stop.value
+            break
+        best = improvement
+        if callback is not None:
+            callback(improvement)
+
+    if best is None:
+        return None
+    return best.path_vec, best.path_cost, best.carbon_cost, iter_counter
+
 if __name__ == "__main__":   
     # help eventually establish individual subfolders for each instance
     #file_path = './GTSP_InstancesText/'
@@ -1,11 +1,99 @@
 from threading import Lock
 import numpy as np
-from sklearn.manifold import MDS
-import matplotlib.pyplot as plt
 import os
+import sys
+from PackedMatrix import PackedSymmetric
+from TourMetrics import tour_cost, tour_metrics
+
+# sklearn and matplotlib are imported where positions and images are
+# produced, the solve path never needs them
+
+# above this many nodes positions come from classical MDS instead of sklearn's SMACOF
+MDS_MAX_NODES = 300
+
+# classical (Torgerson) MDS: the top eigenvectors of the double-centered
+# squared distance matrix, one symmetric eigendecomposition instead of SMACOF's
+# iterative majorization
+def classical_mds(distances, n_components=2):
+    squared = np.square(distances)
+    centered = squared - squared.mean(axis=0) - squared.mean(axis=1)[:, np.newaxis] + squared.mean()
+    eigenvalues, eigenvectors = np.linalg.eigh(-0.5 * centered)
+    top = np.argsort(eigenvalues)[::-1][:n_components]
+    return eigenvectors[:, top] * np.sqrt(np.maximum(eigenvalues[top], 0))
+
+# read-only arrays published by AntGraph.publish_shared
+SHARED_ARRAYS = ('delta_mat', 'carbon_mat', 'scaled_mat', 'attract_mat', 'cluster_offsets', 'cluster_members', 'cluster_of')
+
+# n x n matrices that follow the node count when nodes are added
+NODE_MATRICES = ('delta_mat', 'carbon_mat', 'scaled_mat', 'tau_mat', 'attract_mat', 'initial_tau')
+
+# SharedMemory registers every attached block with the resource tracker, which
+# would unlink it when the attaching process exits (Python < 3.13). Child
+# processes of the multiprocessing module share the publisher's tracker, where
+# the block is already registered, so only unrelated processes unregister.
+def unregister_shared(block):
+    import multiprocessing
+    from multiprocessing import resource_tracker
+
+    if multiprocessing.parent_process() is None:
+        resource_tracker.unregister(block._name, 'shared_memory')
+
+def to_list(matrix):
+    if isinstance(matrix, np.ndarray):
+        return matrix.tolist()
+    return matrix
+
+# storage dtype for distances with delta_dtype='auto': the smallest of uint16
+# and int32 that holds integral distances, float64 otherwise
+def compact_delta_dtype(delta_mat):
+    values = np.asarray(delta_mat.data if isinstance(delta_mat, PackedSymmetric) else delta_mat)
+    if values.size == 0 or not np.array_equal(values, np.round(values)):
+        return np.float64
+    for dtype in (np.uint16, np.int32):
+        if values.min() >= np.iinfo(dtype).min and values.max() <= np.iinfo(dtype).max:
+            return dtype
+    return np.float64
+
+# raise if values cannot be stored in dtype: out of range (or fractional) for
+# an integer dtype, beyond the largest finite value for a float dtype
+def check_dtype(values, dtype, name):
+    values = np.asarray(values.data if isinstance(values, PackedSymmetric) else values)
+    dtype = np.dtype(dtype)
+    if values.size == 0:
+        return
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() > info.max:
+            raise Exception("%s values outside [%s, %s] do not fit in %s" % (name, info.min, info.max, dtype.name))
+        if not np.issubdtype(values.dtype, np.integer) and not np.array_equal(values, np.round(values)):
+            raise Exception("%s has fractional values, %s would truncate them" % (name, dtype.name))
+    elif np.issubdtype(dtype, np.floating):
+        finite = values[np.isfinite(values)]
+        if finite.size and np.abs(finite).max() > np.finfo(dtype).max:
+            raise Exception("%s values overflow %s" % (name, dtype.name))
+
+# bytes held by a matrix; nested lists are estimated in O(1) from the first
+# row and value, every row and cell taken to be as large as those
+def matrix_bytes(matrix):
+    if isinstance(matrix, (np.ndarray, PackedSymmetric)):
+        return matrix.nbytes
+    total = sys.getsizeof(matrix)
+    if len(matrix) == 0:
+        return total
+    row = matrix[0]
+    cell = sys.getsizeof(row[0]) if len(row) else 0
+    return total + len(matrix) * (sys.getsizeof(row) + len(row) * cell)
+
+def to_packed(matrix, dtype):
+    if isinstance(matrix, PackedSymmetric):
+        if matrix.dtype != dtype:
+            return matrix.astype(dtype)
+        return matrix
+    return PackedSymmetric.from_matrix(matrix, dtype)
 
 class AntGraph:
-    def __init__(self, instance_name, num_ants, num_nodes, delta_mat, carbon_mat, scaled_mat, clusters_mat, tau_mat=None):
+    def __init__(self, instance_name, num_ants, num_nodes, delta_mat, carbon_mat, scaled_mat, clusters_mat, tau_mat=None,
+                 vectorized=False, dtype=np.float64, positions=None, symmetric=False, delta_dtype=None):
         #print (len(delta_mat))
         if len(delta_mat) != num_nodes:
             raise Exception("len(delta) != num_nodes")
@@ -13,41 +101,158 @@ class AntGraph:
         self.instance_name = instance_name
         self.num_ants = num_ants
         self.num_nodes = num_nodes
-        self.delta_mat = delta_mat # matrix of node distance deltas
-        self.carbon_mat = carbon_mat
-        self.scaled_mat = scaled_mat
         self.clusters_mat = clusters_mat
+        self.num_clusters = len(clusters_mat)
         self.lock = Lock()
+        self.build_cluster_index()
 
-        # symmetrizing the matrix by taking the average of the matrix and its transpose
-        # can alternatively be done with checking if a matrix is symmetric
-        temp_delta_mat = np.array(delta_mat)
-        symmetric_distances = (temp_delta_mat + temp_delta_mat.T)/2
+        # vectorized mode keeps every matrix as a contiguous ndarray so that
+        # ants and colonies can work on whole rows instead of single cells
+        self.vectorized = vectorized
+        self.dtype = dtype
+
+        # dtype is the storage of the carbon, scaled, pheromone and
+        # attractiveness matrices (e.g. float32), delta_dtype that of the
+        # distances (uint16, int32, or 'auto' for the smallest that fits);
+        # both are checked against the values, list mode ignores them
+        if delta_dtype is None:
+            delta_dtype = dtype
+        elif delta_dtype == 'auto':
+            delta_dtype = compact_delta_dtype(delta_mat)
+        self.delta_dtype = delta_dtype
+        if vectorized:
+            check_dtype(delta_mat, delta_dtype, 'delta_mat')
+            check_dtype(carbon_mat, dtype, 'carbon_mat')
+            check_dtype(scaled_mat, dtype, 'scaled_mat')
+
+        # symmetric mode (vectorized only) keeps one entry per node pair, see
+        # PackedMatrix.py; the matrices passed in must be symmetric and a
+        # pheromone write applies to both directions
+        self.symmetric = symmetric
+        if symmetric and not vectorized:
+            raise Exception("symmetric mode requires a vectorized graph")
+        if symmetric:
+            self.delta_mat = to_packed(delta_mat, delta_dtype)
+            self.carbon_mat = to_packed(carbon_mat, dtype)
+            self.scaled_mat = to_packed(scaled_mat, dtype)
+        elif vectorized:
+            self.delta_mat = np.ascontiguousarray(delta_mat, dtype=delta_dtype) # matrix of node distance deltas
+            self.carbon_mat = np.ascontiguousarray(carbon_mat, dtype=dtype)
+            self.scaled_mat = np.ascontiguousarray(scaled_mat, dtype=dtype)
+        else:
+            # list mode works on nested Python lists
+            self.delta_mat = to_list(delta_mat) # matrix of node distance deltas
+            self.carbon_mat = to_list(carbon_mat)
+            self.scaled_mat = to_list(scaled_mat)
+
+        # static etha^Beta * scaled_emission, built once per run on first use
+        self.attract_mat = None
+        self.attract_beta = None
 
-        # applying MDS
-        mds = MDS(n_components=2, dissimilarity="precomputed", random_state=6)
-        positions = mds.fit_transform(symmetric_distances)
+        # shared memory blocks backing the read-only arrays, see publish_shared
+        self.shared_blocks = []
+        self.owns_shared = False
 
-        self.positions = []
-        for i in range(len(positions)):
-            self.positions.append((positions[i, 0], positions[i, 1]))
+        # incremental changes (see Incremental.py): removed nodes leave their slot
+        # in free_nodes for the next added node, and in vectorized mode the
+        # matrices are views into buffers of capacity x capacity cells, grown
+        # geometrically so that adding a node costs O(n) amortized
+        self.free_nodes = []
+        self.capacity = num_nodes
+        self.node_buffers = {}
+        self.max_carbon = None
+        # objective matrices of the improvement stages by carbon weight, see
+        # LocalSearch.objective_matrix; cleared when the edges change
+        self.objectives = {}
 
-        # tau mat contains the amount of phermone at node x,y
-        if tau_mat is None:
+        # 2-D layout used only by create_image, computed on first use unless
+        # coordinates are supplied (e.g. from a positions file)
+        self._positions = None
+        if positions is not None:
+            self._positions = [(float(x), float(y)) for x, y in positions]
+
+        # tau mat contains the amount of phermone at node x,y; a tau_mat passed
+        # in (e.g. a saved pheromone state) is kept as initial_tau and is what
+        # reset_tau restores instead of the uniform tau0
+        self.initial_tau = None
+        if tau_mat is not None:
+            if len(tau_mat) != num_nodes:
+                raise Exception("len(tau) != num_nodes")
+            if symmetric:
+                self.initial_tau = to_packed(tau_mat, dtype).copy()
+            elif vectorized:
+                self.initial_tau = np.array(tau_mat, dtype=dtype)
+            else:
+                self.initial_tau = [list(row) for row in to_list(tau_mat)]
+
+        if symmetric:
+            self.tau_mat = PackedSymmetric(num_nodes, dtype=dtype)
+            if self.initial_tau is not None:
+                self.tau_mat[...] = self.initial_tau
+        elif vectorized:
+            self.tau_mat = np.zeros((num_nodes, num_nodes), dtype=dtype)
+            if self.initial_tau is not None:
+                self.tau_mat[...] = self.initial_tau
+        else:
             self.tau_mat = []
             for i in range(0, num_nodes):
-                self.tau_mat.append([0]*num_nodes)
+                if self.initial_tau is not None:
+                    self.tau_mat.append(list(self.initial_tau[i]))
+                else:
+                    self.tau_mat.append([0]*num_nodes)
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = self.compute_positions()
+        return self._positions
+
+    @positions.setter
+    def positions(self, positions):
+        self._positions = positions
+
+    def compute_positions(self):
+        # symmetrizing the matrix by taking the average of the matrix and its transpose
+        # can alternatively be done with checking if a matrix is symmetric
+        temp_delta_mat = np.array(self.delta_mat, dtype=np.float64)
+        if self.symmetric:
+            symmetric_distances = temp_delta_mat
+        else:
+            symmetric_distances = (temp_delta_mat + temp_delta_mat.T)/2
 
+        if self.num_nodes <= MDS_MAX_NODES:
+            from sklearn.manifold import MDS
+
+            # applying MDS
+            mds = MDS(n_components=2, dissimilarity="precomputed", random_state=6)
+            positions = mds.fit_transform(symmetric_distances)
+        else:
+            # SMACOF is too slow for large instances, use classical MDS instead
+            positions = classical_mds(symmetric_distances)
+
+        return [(float(positions[i, 0]), float(positions[i, 1])) for i in range(len(positions))]
+
+    # vectorized cells are returned as Python numbers, so that sums of compact
+    # integer distances cannot wrap around; a packed matrix has no cheap rows,
+    # so cells are read as [r, s]
     def delta(self, r, s):
+        if self.vectorized:
+            return self.delta_mat[r, s].item()
         return self.delta_mat[r][s]
 
     def carbon(self, r, s):
+        if self.vectorized:
+            return self.carbon_mat[r, s].item()
         return self.carbon_mat[r][s]
     
     def scaled_emission(self, r, s):
+        if self.vectorized:
+            return self.scaled_mat[r, s].item()
         return self.scaled_mat[r][s]
 
     def tau(self, r, s):
+        if self.vectorized:
+            return self.tau_mat[r, s].item()
         return self.tau_mat[r][s]
 
     # 1 / delta = eta or etha 
@@ -56,12 +261,249 @@ class AntGraph:
             return float('inf')
         return 1.0 / self.delta(r, s)
 
-    # inner locks most likely not necessary
+    # etha^Beta * scaled_emission for every edge, only available in vectorized mode
+    # the matrix is static for a given Beta so it is only computed once per run
+    def attractiveness(self, Beta):
+        if not self.vectorized:
+            raise Exception("attractiveness requires a vectorized graph")
+        if self.attract_mat is None or self.attract_beta != Beta:
+            # zero distances give an infinite etha, same as etha()
+            if self.symmetric:
+                with np.errstate(divide='ignore'):
+                    etha_data = 1.0 / self.delta_mat.data
+                self.attract_mat = PackedSymmetric(self.num_nodes, (np.power(etha_data, Beta) * self.scaled_mat.data).astype(self.dtype))
+            else:
+                with np.errstate(divide='ignore'):
+                    etha_mat = 1.0 / self.delta_mat
+                self.attract_mat = np.ascontiguousarray(np.power(etha_mat, Beta) * self.scaled_mat, dtype=self.dtype)
+            self.attract_beta = Beta
+        return self.attract_mat
+
+    # slots for count new nodes, freed slots first; cells of new nodes start at
+    # zero and their tau at tau0
+    def allocate_nodes(self, count):
+        nodes = self.free_nodes[:count]
+        del self.free_nodes[:count]
+        num_appended = count - len(nodes)
+        nodes += list(range(self.num_nodes, self.num_nodes + num_appended))
+        if num_appended > 0:
+            self.resize_nodes(self.num_nodes + num_appended)
+
+        for name in NODE_MATRICES:
+            if getattr(self, name) is not None:
+                self.fill_edges(name, nodes, 0)
+        tau0 = getattr(self, 'tau0', 0)
+        self.fill_edges('tau_mat', nodes, tau0)
+        if self.initial_tau is not None:
+            self.fill_edges('initial_tau', nodes, tau0)
+        return nodes
+
+    def resize_nodes(self, num_nodes):
+        if self.shared_blocks:
+            raise Exception("cannot resize a graph in shared memory")
+
+        old_num_nodes = self.num_nodes
+        self.num_nodes = num_nodes
+        if num_nodes > self.capacity:
+            self.capacity = max(num_nodes, self.capacity + max(16, self.capacity // 4))
+        for name in NODE_MATRICES:
+            matrix = getattr(self, name)
+            if matrix is None:
+                continue
+            if not self.vectorized:
+                for row in matrix:
+                    row.extend([0] * (num_nodes - old_num_nodes))
+                for i in range(old_num_nodes, num_nodes):
+                    matrix.append([0] * num_nodes)
+                continue
+            if isinstance(matrix, PackedSymmetric):
+                # the packed layout grows by appending rows
+                matrix.resize(num_nodes)
+                continue
+
+            # a matrix that is not a view of its buffer (first resize, or
+            # replaced since) is copied into a new one
+            buffer = self.node_buffers.get(name)
+            if buffer is None or matrix.base is not buffer or len(buffer) < num_nodes:
+                buffer = np.zeros((self.capacity, self.capacity), dtype=matrix.dtype)
+                buffer[:old_num_nodes, :old_num_nodes] = matrix
+                self.node_buffers[name] = buffer
+            setattr(self, name, buffer[:num_nodes, :num_nodes])
+
+        if self._positions is not None:
+            self._positions = self._positions + [(0.0, 0.0)] * (num_nodes - old_num_nodes)
+        self.build_cluster_index()
+
+    def fill_edges(self, name, nodes, value):
+        matrix = getattr(self, name)
+        if self.vectorized:
+            nodes = np.asarray(nodes, dtype=np.int64)
+            matrix[nodes, :] = value
+            matrix[:, nodes] = value
+            return
+
+        for node in nodes:
+            matrix[node][:] = [value] * self.num_nodes
+        for row in matrix:
+            for node in nodes:
+                row[node] = value
+
+    # rows[i] is the row of nodes[i], cols[j] the column entries of node j for
+    # every node
+    def set_edges(self, name, nodes, rows, cols):
+        matrix = getattr(self, name)
+        if self.vectorized:
+            check_dtype(rows, matrix.dtype, name)
+            check_dtype(cols, matrix.dtype, name)
+            nodes = np.asarray(nodes, dtype=np.int64)
+            matrix[nodes, :] = rows
+            matrix[:, nodes] = cols
+            return
+
+        for node, row in zip(nodes, rows):
+            matrix[node][:] = list(row)
+        for j, col in enumerate(cols):
+            for node, val in zip(nodes, col):
+                matrix[j][node] = val
+
+    # recompute the cached attractiveness for the rows and columns of nodes
+    def refresh_attractiveness(self, nodes):
+        if self.attract_mat is None:
+            return
+        nodes = np.asarray(nodes, dtype=np.int64)
+        with np.errstate(divide='ignore'):
+            self.attract_mat[nodes, :] = np.power(1.0 / self.delta_mat[nodes, :], self.attract_beta) * self.scaled_mat[nodes, :]
+            self.attract_mat[:, nodes] = np.power(1.0 / self.delta_mat[:, nodes], self.attract_beta) * self.scaled_mat[:, nodes]
+
+    # bytes per matrix (allocated capacity included) plus the cluster index,
+    # and their total
+    def memory_footprint(self):
+        footprint = {}
+        for name in NODE_MATRICES:
+            matrix = getattr(self, name)
+            if matrix is None:
+                continue
+            buffer = self.node_buffers.get(name)
+            if isinstance(matrix, np.ndarray) and buffer is not None and matrix.base is buffer:
+                matrix = buffer
+            elif isinstance(matrix, PackedSymmetric):
+                matrix = matrix.buffer
+            footprint[name] = matrix_bytes(matrix)
+        footprint['clusters'] = self.cluster_offsets.nbytes + self.cluster_members.nbytes + self.cluster_of.nbytes
+        footprint['total'] = sum(footprint.values())
+        return footprint
+
+    # largest carbon value, the normalizer of scaled_mat for added edges
+    def carbon_max(self):
+        if self.max_carbon is None:
+            self.max_carbon = float(np.max(self.carbon_mat))
+        return self.max_carbon
+
+    # replace the cluster membership, nodes outside every cluster are never
+    # visited
+    def set_clusters(self, clusters_mat):
+        self.clusters_mat = [list(cluster) for cluster in clusters_mat]
+        self.num_clusters = len(self.clusters_mat)
+        self.build_cluster_index()
+
+    # callers already hold graph.lock where exclusive access is needed
     def update_tau(self, r, s, val):
-        lock = Lock()
-        lock.acquire()
+        if self.vectorized:
+            self.tau_mat[r, s] = val
+            return
         self.tau_mat[r][s] = val
-        lock.release()
+
+    # copy the read-only matrices, the cluster arrays and the attractiveness
+    # matrix for Beta into multiprocessing.shared_memory blocks; the graph then
+    # works on the shared copies and the returned handle lets other processes
+    # attach to them without copying (tau stays private to every process)
+    def publish_shared(self, Beta=1):
+        from multiprocessing import shared_memory
+
+        if not self.vectorized:
+            raise Exception("publish_shared requires a vectorized graph")
+        self.attractiveness(Beta)
+
+        handle = {
+            'instance_name': self.instance_name,
+            'num_ants': self.num_ants,
+            'num_nodes': self.num_nodes,
+            'dtype': np.dtype(self.dtype).str,
+            'delta_dtype': np.dtype(self.delta_dtype).str,
+            'attract_beta': Beta,
+            'symmetric': self.symmetric,
+            'arrays': {},
+        }
+        for name in SHARED_ARRAYS:
+            # packed matrices share their data array
+            matrix = getattr(self, name)
+            array = matrix.data if isinstance(matrix, PackedSymmetric) else matrix
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            if isinstance(matrix, PackedSymmetric):
+                shared = PackedSymmetric(self.num_nodes, shared)
+            setattr(self, name, shared)
+            handle['arrays'][name] = (block.name, array.shape, array.dtype.str)
+            self.shared_blocks.append(block)
+        self.owns_shared = True
+        return handle
+
+    # build a graph on top of the blocks published by another process
+    @classmethod
+    def attach_shared(cls, handle):
+        from multiprocessing import shared_memory
+
+        blocks = []
+        arrays = {}
+        for name, (block_name, shape, dtype) in handle['arrays'].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            # attaching processes must not unlink the blocks when they exit
+            unregister_shared(block)
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            if handle['symmetric'] and name in ('delta_mat', 'carbon_mat', 'scaled_mat', 'attract_mat'):
+                array = PackedSymmetric(handle['num_nodes'], array)
+            arrays[name] = array
+            blocks.append(block)
+
+        offsets = arrays['cluster_offsets']
+        members = arrays['cluster_members']
+        clusters_mat = [members[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+
+        # dtypes match, so the constructor keeps the shared arrays without copying
+        graph = cls(handle['instance_name'], handle['num_ants'], handle['num_nodes'], arrays['delta_mat'], arrays['carbon_mat'],
+                    arrays['scaled_mat'], clusters_mat, vectorized=True, dtype=np.dtype(handle['dtype']), symmetric=handle['symmetric'],
+                    delta_dtype=np.dtype(handle['delta_dtype']))
+        for name in ('cluster_offsets', 'cluster_members', 'cluster_of'):
+            setattr(graph, name, arrays[name])
+        graph.attract_mat = arrays['attract_mat']
+        graph.attract_beta = handle['attract_beta']
+        graph.shared_blocks = blocks
+        return graph
+
+    # detach from the shared blocks, the publishing graph also frees them; the
+    # publisher goes back to private copies of its arrays, an attached graph
+    # drops them so that later use fails with an error instead of reading
+    # unmapped memory
+    def release_shared(self):
+        if not self.shared_blocks:
+            return
+        for name in SHARED_ARRAYS:
+            matrix = getattr(self, name)
+            if not self.owns_shared:
+                matrix = None
+            elif isinstance(matrix, PackedSymmetric):
+                matrix = matrix.copy()
+            else:
+                matrix = np.array(matrix)
+            setattr(self, name, matrix)
+        for block in self.shared_blocks:
+            block.close()
+            if self.owns_shared:
+                block.unlink()
+        self.shared_blocks = []
+        self.owns_shared = False
 
     def reset_tau(self):
         lock = Lock()
@@ -74,9 +516,18 @@ class AntGraph:
         #print ("Average = %s" % (avg,))
         #print ("Tau0 = %s" % (self.tau0))
 
-        for r in range(0, self.num_nodes):
-            for s in range(0, self.num_nodes):
-                self.tau_mat[r][s] = self.tau0
+        if self.vectorized:
+            if self.initial_tau is not None:
+                self.tau_mat[...] = self.initial_tau
+            else:
+                self.tau_mat.fill(self.tau0)
+        else:
+            for r in range(0, self.num_nodes):
+                for s in range(0, self.num_nodes):
+                    if self.initial_tau is not None:
+                        self.tau_mat[r][s] = self.initial_tau[r][s]
+                    else:
+                        self.tau_mat[r][s] = self.tau0
         lock.release()
 
     # average delta in delta matrix
@@ -89,6 +540,8 @@ class AntGraph:
 
     # average val of a matrix
     def average(self, matrix):
+        if self.vectorized:
+            return float(np.mean(matrix))
         sum = 0
         for r in range(0, self.num_nodes):
             for s in range(0, self.num_nodes):
@@ -97,29 +550,35 @@ class AntGraph:
         avg = sum / (self.num_nodes * self.num_nodes)
         return avg
     
+    # cluster_of maps every node to its cluster id (-1 if it belongs to none),
+    # cluster membership is kept CSR-style: the nodes of cluster c are
+    # cluster_members[cluster_offsets[c]:cluster_offsets[c+1]]
+    def build_cluster_index(self):
+        sizes = np.array([len(cluster) for cluster in self.clusters_mat], dtype=np.int64)
+        self.cluster_offsets = np.zeros(self.num_clusters + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.cluster_offsets[1:])
+        self.cluster_members = np.array([node for cluster in self.clusters_mat for node in cluster], dtype=np.int64)
+
+        self.cluster_of = np.full(self.num_nodes, -1, dtype=np.int64)
+        self.cluster_of[self.cluster_members] = np.repeat(np.arange(self.num_clusters, dtype=np.int64), sizes)
+
     # get the cluster id of a given node
     def get_cluster(self, s):
-        for i in range(len(self.clusters_mat)):
-            cluster = self.clusters_mat[i]
-            for j in range(len(cluster)):
-                if cluster[j] == s:
-                    return i
+        return int(self.cluster_of[s])
+
+    # nodes belonging to cluster c
+    def get_members(self, c):
+        return self.cluster_members[self.cluster_offsets[c]:self.cluster_offsets[c + 1]]
     
     def carbon_cost(self, best_path_vec, carbon_mat):
-        carbon_total = 0
-        for i in range(len(best_path_vec)):
-            if i+1 != len(best_path_vec):
-                city_one = best_path_vec[i]
-                city_two = best_path_vec[i+1]
-                carbon_total += carbon_mat[city_one][city_two]
-            else: 
-                city_one = best_path_vec[i]
-                city_two = best_path_vec[0]
-                carbon_total += carbon_mat[city_one][city_two]
-        return carbon_total
+        # see TourMetrics.py, vectorized matrices are summed in float64
+        return tour_cost(carbon_mat, best_path_vec)
     
-    # create image
-    def create_image(self, iteration, best_path_vec, best_path_cost):
+    # create image, saved under ./image/<instance>/ unless output (a path or a
+    # file-like object) is given
+    def create_image(self, iteration, best_path_vec, best_path_cost, output=None):
+        import matplotlib.pyplot as plt
+
         # hard-coded colors, can change later
         # (R, G, B, Opacity)
         colors = ['blue', 'orange', 'purple', 'gray', 'yellow', 
@@ -171,27 +630,20 @@ class AntGraph:
             ax.set_xlabel('')
             ax.set_ylabel('')
             '''
-            total_carbon = 0
-            total_cost = 0
-
-            for i in range(len(best_path_vec)):
-                r = best_path_vec[i]
-                s = best_path_vec[0]
-                if (i + 1) != len(best_path_vec):
-                    s = best_path_vec[i + 1]
-                total_carbon += self.carbon(r, s)
-                total_cost += self.delta(r, s)
+            total_cost, total_carbon = tour_metrics(self, best_path_vec)
             #print("Carbon = ", total_carbon, " Cost = ", total_cost)
 
             ax.set_title('I:' + iteration + ',' + 'Cost:' + str(int(best_path_cost)) + ',' 
                         + 'Carbon:' + str(int(total_carbon)), fontsize=6)
         # save the plot to a file
-        directory_path = './image/' + self.instance_name + '/'
-        # Check if the directory exists
-        if not os.path.exists(directory_path):
-            # If the directory does not exist, create it
-            os.makedirs(directory_path)
-        plt.savefig(directory_path + 'pic_iter_' + iteration + "_num_ants_" + str(self.num_ants) +'.png', format='png', dpi=200, bbox_inches='tight', pad_inches=0)
+        if output is None:
+            directory_path = './image/' + self.instance_name + '/'
+            # Check if the directory exists
+            if not os.path.exists(directory_path):
+                # If the directory does not exist, create it
+                os.makedirs(directory_path)
+            output = directory_path + 'pic_iter_' + iteration + "_num_ants_" + str(self.num_ants) +'.png'
+        plt.savefig(output, format='png', dpi=200, bbox_inches='tight', pad_inches=0)
         plt.close('all')
 
 
@@ -0,0 +1,146 @@
+import numpy as np
+from AntColony import AntColony
+
+# Lockstep alternative to the threaded AntColony: instead of one Ant thread per
+# ant, every ant advances one step at a time and the whole colony is kept in
+# (num_ants x num_nodes) arrays (positions, feasibility masks, candidate scores).
+# Requires a vectorized AntGraph.
+class BatchAntColony(AntColony):
+    def __init__(self, graph, num_ants, num_iterations, seed=None, termination=None, on_improvement=None, seed_tours=None,
+                 local_search=None, cluster_optimization=None):
+        if not graph.vectorized:
+            raise Exception("BatchAntColony requires a vectorized graph")
+
+        # same meaning as in Ant
+        self.Beta = 1
+        self.Q0 = 0.5
+        self.Rho = 0.99
+
+        self.rng = np.random.default_rng(seed)
+        AntColony.__init__(self, graph, num_ants, num_iterations, termination, on_improvement, seed_tours, local_search,
+                           cluster_optimization)
+
+    def start(self, start_time=None, resume=False, extra_iterations=None):
+        for iter_counter in self.run(start_time, resume, extra_iterations):
+            pass
+
+    # generator form of start, yields the iteration counter after every step so
+    # a caller can look at the colony in between iterations
+    def run(self, start_time=None, resume=False, extra_iterations=None):
+        if not resume:
+            self.reset()
+            self.iter_counter = 0
+        self.begin_termination(start_time, extra_iterations)
+        if not resume:
+            self.plant_seed_tours()
+
+        while self.iter_counter < self.iteration_limit:
+            self.step()
+            stop = self.check_termination()
+            yield self.iter_counter
+            if stop:
+                break
+        self.finish_tours()
+
+    # one iteration followed by the global pheromone update
+    def step(self):
+        self.iteration()
+        self.global_updating_rule()
+
+    # one iteration builds the tours of all ants together, one cluster per step
+    def iteration(self):
+        graph = self.graph
+        self.iter_counter += 1
+
+        attract = graph.attractiveness(self.Beta)
+        tau = graph.tau_mat
+        delta = graph.delta_mat
+        cluster_of = graph.cluster_of
+
+        # assign each ant a random start-node, nodes outside every cluster are skipped
+        start = graph.cluster_members[self.rng.integers(0, len(graph.cluster_members), size=self.num_ants)]
+        curr = start
+        feasible = (cluster_of >= 0)[np.newaxis, :] & (cluster_of[np.newaxis, :] != cluster_of[curr][:, np.newaxis])
+
+        paths = np.empty((self.num_ants, graph.num_clusters), dtype=np.int64)
+        paths[:, 0] = start
+        costs = np.zeros(self.num_ants)
+
+        for step in range(1, graph.num_clusters):
+            new = self.state_transition_rule(curr, feasible, tau, attract)
+            costs += delta[curr, new]
+            paths[:, step] = new
+            # the cluster of the chosen node is done for that ant
+            feasible &= cluster_of[np.newaxis, :] != cluster_of[new][:, np.newaxis]
+
+            self.local_updating_rule(curr, new)
+            curr = new
+
+        # don't forget to close the tour
+        costs += delta[curr, start]
+
+        self.update_batch(paths, costs)
+        self.improve_tours(paths, costs)
+
+    # same rule as Ant.state_transition_rule, for all ants at once
+    def state_transition_rule(self, curr, feasible, tau, attract):
+        if self.graph.symmetric:
+            # one packed index for the rows of both matrices
+            index = tau.key_index(curr)
+            tau_rows = tau.data.take(index)
+            attract_rows = attract.data.take(index)
+        else:
+            tau_rows = tau[curr]
+            attract_rows = attract[curr]
+        if np.any(feasible & (tau_rows == 0)):
+            raise Exception("tau = 0")
+        if not feasible.any(axis=1).all():
+            raise Exception("max_node < 0")
+
+        with np.errstate(invalid='ignore'):
+            scores = np.where(feasible, tau_rows * attract_rows, 0.0)
+        exploit = self.rng.random(self.num_ants) < self.Q0
+
+        # exploitation: masked argmax (scores are never negative, so -1 excludes a node)
+        best = np.argmax(np.where(feasible, scores, -1.0), axis=1)
+
+        # exploration: one cumulative-sum draw per ant, falling back to a uniform
+        # pick over the feasible nodes when all scores are zero, and over the
+        # infinitely attractive (zero distance) nodes when the sum is infinite
+        total = scores.sum(axis=1)
+        weights = scores
+        uniform = total == 0
+        infinite = np.isinf(total)
+        if uniform.any() or infinite.any():
+            weights = scores.copy()
+            weights[uniform] = feasible[uniform]
+            weights[infinite] = np.isinf(scores[infinite])
+
+        cumulative = np.cumsum(weights, axis=1)
+        draw = self.rng.random(self.num_ants) * cumulative[:, -1]
+        sampled = (cumulative <= draw[:, np.newaxis]).sum(axis=1)
+        sampled = np.minimum(sampled, self.graph.num_nodes - 1)
+
+        return np.where(exploit, best, sampled)
+
+    # local phermone update for the edges taken in one step; an edge taken by
+    # k ants gets the single-ant rule applied k times (in symmetric mode both
+    # directions of a pair count as the same edge)
+    def local_updating_rule(self, curr, new):
+        graph = self.graph
+        if graph.symmetric:
+            curr, new = np.maximum(curr, new), np.minimum(curr, new)
+        keys, counts = np.unique(curr * graph.num_nodes + new, return_counts=True)
+        r = keys // graph.num_nodes
+        s = keys % graph.num_nodes
+
+        decay = (1 - self.Rho) ** counts
+        graph.tau_mat[r, s] = decay * graph.tau_mat[r, s] + (1 - decay) * graph.tau0 * graph.scaled_mat[r, s]
+
+    # book-keeping for one iteration of tours
+    def update_batch(self, paths, costs):
+        self.avg_path_cost = costs.mean()
+
+        best = int(np.argmin(costs))
+        if costs[best] < self.best_path_cost:
+            self.record_best(paths[best].tolist(), costs[best].item())
@@ -0,0 +1,132 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import AntGTSP
+from GTSPInstance import file_hash
+
+# Runs every instance of one or more directories on a process pool.
+# Each finished instance is appended to the results file as one line, keyed by
+# the instance content and the solver parameters, so an interrupted sweep can
+# be resumed (and an edited instance or changed parameter is run again).
+
+RESULTS_PATH = './batch_results.csv'
+RESULTS_HEADER = 'Project,Cost,Carbon,Scalar,Time,Iter,Key\n'
+
+# number of nodes from the first header line ("N: 48")
+def read_num_nodes(path):
+    with open(path, 'r', encoding='iso-8859-1') as f:
+        return int(f.readline().strip().split()[1])
+
+# n^2 x iterations, the scale of a run's pheromone work
+def estimated_cost(path):
+    num_nodes = read_num_nodes(path)
+    num_ants, num_iterations, num_repetitions = AntGTSP.default_parameters(num_nodes)
+    return num_nodes * num_nodes * num_iterations * num_repetitions
+
+def run_key(path, params):
+    digest = hashlib.sha1(file_hash(path).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def completed_keys(results_path):
+    keys = set()
+    if not os.path.exists(results_path):
+        return keys
+
+    with open(results_path, 'r') as f:
+        header = f.readline()
+        if header and header != RESULTS_HEADER:
+            raise Exception("unexpected header in %s, expected %s" % (results_path, RESULTS_HEADER.strip()))
+        for line in f:
+            columns = line.strip().split(',')
+            # a line cut short by a crash has no key and is simply run again
+            if len(columns) == RESULTS_HEADER.count(',') + 1:
+                keys.add(columns[-1])
+    return keys
+
+# one write() on an O_APPEND descriptor, so a row is either fully there or not at all
+def append_line(results_path, line):
+    fd = os.open(results_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# runs in a worker process; the solver's per-step output is discarded and its
+# errors are raised to the parent
+def solve_instance(file_path, input_file, params):
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = AntGTSP.solve(file_path, input_file, create_images=False, raise_errors=True, **params)
+    time_taken = time.time() - start_time
+
+    best_path_vec, best_path_cost, c_cost, iter_counter = result
+    return best_path_cost, c_cost, time_taken, iter_counter
+
+def run_batch(directories, results_path=RESULTS_PATH, workers=None, params=None):
+    params = dict(params or {})
+    key_params = dict(params, scalar=AntGTSP.scalar)
+
+    if not os.path.exists(results_path) or os.path.getsize(results_path) == 0:
+        append_line(results_path, RESULTS_HEADER)
+    done = completed_keys(results_path)
+
+    jobs = []
+    for directory in directories:
+        file_path = os.path.join(directory, '')
+        for input_file in sorted(os.listdir(file_path)):
+            if not input_file.endswith('.txt'):
+                continue
+            key = run_key(file_path + input_file, key_params)
+            if key in done:
+                continue
+            jobs.append((estimated_cost(file_path + input_file), file_path, input_file, key))
+
+    # largest instances first so the long runs do not end up alone at the tail
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    print ("%s instances to run, %s already done" % (len(jobs), len(done)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for cost, file_path, input_file, key in jobs:
+            futures[executor.submit(solve_instance, file_path, input_file, params)] = (file_path, input_file, key)
+
+        for future in as_completed(futures):
+            file_path, input_file, key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = None
+                print ("exception in %s: %s" % (input_file, e))
+            if result is None:
+                print ("Failed %s%s" % (file_path, input_file))
+                continue
+
+            best_path_cost, c_cost, time_taken, iter_counter = result
+            append_line(results_path, input_file[:-4] + ',' + str(best_path_cost) + ',' + str(c_cost) + ',' + str(AntGTSP.scalar) + ','
+                        + str(time_taken) + ',' + str(iter_counter) + ',' + key + '\n')
+            print ("Finished %s%s in %.1fs" % (file_path, input_file, time_taken))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Solve every instance in the given directories on a process pool.')
+    parser.add_argument('directories', nargs='+')
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', default='batch', choices=['threaded', 'batch'])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'])
+    parser.add_argument('--delta-dtype', default=None, choices=['auto', 'uint16', 'int32', 'float32', 'float64'])
+    args = parser.parse_args()
+
+    params = {'engine': args.engine, 'seed': args.seed}
+    # only non-default precisions enter the params, so earlier results keep their keys
+    if args.dtype != 'float64':
+        params['dtype'] = args.dtype
+    if args.delta_dtype is not None:
+        params['delta_dtype'] = args.delta_dtype
+    run_batch(args.directories, args.results, args.workers, params)
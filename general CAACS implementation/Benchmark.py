@@ -0,0 +1,178 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import AntGTSP
+from AntColony import AntColony
+from BatchAntColony import BatchAntColony
+from ClusterOptimization import ClusterOptimizer
+from GTSPInstance import read_reference_solution
+from LocalSearch import LocalSearch
+from TourMetrics import tour_cost, tour_metrics
+
+# Solution quality against the empirical solutions: every instance is solved
+# repetitions times with the seeds seed, seed + 1, ... and each run reports
+#   gap             (cost - reference) / reference
+#   time_to_target  seconds until the best tour was within target of the
+#                   reference (from the improvement callback), None if never
+#   iterations, tours_per_second
+# and the instance its peak RSS. Each instance runs in a fresh worker process
+# so that the peak RSS is its own. The JSON output carries the commit and the
+# parameters, for comparing the results of two commits.
+
+INSTANCE_DIR = '../empirical instances/'
+SOLUTION_DIR = '../empirical solutions/'
+OUTPUT_PATH = './benchmark.json'
+DEFAULT_INSTANCES = ('10att48', '11berlin52', '20kroA100', '40kroa200')
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_once(graph, engine, seed, num_ants, num_iterations, reference_cost, target, params):
+    improvements = []
+    graph.reset_tau()
+    stages = {'local_search': params.get('local_search'), 'cluster_optimization': params.get('cluster_optimization')}
+    if engine == 'batch':
+        colony = BatchAntColony(graph, num_ants, num_iterations, seed=seed, on_improvement=improvements.append, **stages)
+    else:
+        random.seed(seed)
+        colony = AntColony(graph, num_ants, num_iterations, on_improvement=improvements.append, **stages)
+
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        colony.start(start_time)
+    elapsed = time.time() - start_time
+
+    reached = [improvement.elapsed for improvement in improvements if improvement.path_cost <= reference_cost * (1 + target)]
+    cost, carbon = tour_metrics(graph, colony.best_path_vec)
+    return {
+        'seed': seed,
+        'cost': cost,
+        'carbon': carbon,
+        'gap': (cost - reference_cost) / reference_cost,
+        'time_to_target': reached[0] if reached else None,
+        'iterations': colony.iter_counter,
+        'tours_per_second': colony.iter_counter * num_ants / elapsed if elapsed > 0 else None,
+        'elapsed': elapsed,
+        'stop_reason': colony.stop_reason,
+    }
+
+# runs in a worker process of its own
+def benchmark_instance(name, instance_dir, solution_dir, repetitions, seed, target, params):
+    params = dict(params)
+    engine = params.pop('engine', 'batch')
+    reference_cost, reference_tour = read_reference_solution(os.path.join(solution_dir, name + '.txt'))
+
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        graph = AntGTSP.build_graph(os.path.join(instance_dir, ''), name + '.txt', vectorized=engine == 'batch', seed=seed,
+                                    symmetric=params.get('symmetric', False), dtype=params.get('dtype', np.float64),
+                                    delta_dtype=params.get('delta_dtype'))
+    build_time = time.time() - start_time
+    num_ants, num_iterations, num_repetitions = AntGTSP.default_parameters(graph.num_nodes)
+    if params.get('num_iterations') is not None:
+        num_iterations = params['num_iterations']
+
+    runs = [run_once(graph, engine, seed + i, num_ants, num_iterations, reference_cost, target, params) for i in range(repetitions)]
+    gaps = [run['gap'] for run in runs]
+    reached = [run['time_to_target'] for run in runs if run['time_to_target'] is not None]
+    return {
+        'instance': name,
+        'num_nodes': graph.num_nodes,
+        'num_clusters': graph.num_clusters,
+        'reference_cost': reference_cost,
+        # the reference tour evaluated on the graph, should equal reference_cost
+        'reference_tour_cost': tour_cost(graph.delta_mat, reference_tour),
+        'build_time': build_time,
+        'runs': runs,
+        'summary': {
+            'best_gap': min(gaps),
+            'mean_gap': float(np.mean(gaps)),
+            'reached_target': len(reached),
+            'mean_time_to_target': float(np.mean(reached)) if reached else None,
+            'mean_iterations': float(np.mean([run['iterations'] for run in runs])),
+            'mean_tours_per_second': float(np.mean([run['tours_per_second'] or 0.0 for run in runs])),
+            'peak_rss_mb': peak_rss_mb(),
+        },
+    }
+
+def run_benchmark(names, instance_dir=INSTANCE_DIR, solution_dir=SOLUTION_DIR, repetitions=3, seed=1, target=0.05, params=None,
+                  output_path=OUTPUT_PATH):
+    params = dict(params or {})
+    results = {
+        'commit': current_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'repetitions': repetitions,
+        'seed': seed,
+        'target': target,
+        'params': describe_params(params),
+        'instances': [],
+    }
+
+    for name in names:
+        name = os.path.splitext(os.path.basename(name))[0]
+        with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+            result = executor.submit(benchmark_instance, name, instance_dir, solution_dir, repetitions, seed, target, params).result()
+        results['instances'].append(result)
+        summary = result['summary']
+        print ("%-12s gap %6.2f%% (best %6.2f%%)  target %s/%s  iter %6.1f  %8.1f tours/s  %7.1f MB"
+               % (name, 100 * summary['mean_gap'], 100 * summary['best_gap'], summary['reached_target'], repetitions,
+                  summary['mean_iterations'], summary['mean_tours_per_second'], summary['peak_rss_mb']))
+
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+# JSON form of the parameters, stages by their settings
+def describe_params(params):
+    described = {}
+    for key, value in params.items():
+        if isinstance(value, (LocalSearch, ClusterOptimizer)):
+            value = dict((k, v) for k, v in vars(value).items() if k not in ('graph', 'weight'))
+        described[key] = value
+    return described
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark solution quality against the empirical solutions.')
+    parser.add_argument('instances', nargs='*', default=list(DEFAULT_INSTANCES), help='instance names, e.g. 10att48')
+    parser.add_argument('--instance-dir', default=INSTANCE_DIR)
+    parser.add_argument('--solution-dir', default=SOLUTION_DIR)
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--target', type=float, default=0.05, help='time-to-target tolerance as a fraction of the reference cost')
+    parser.add_argument('--engine', default='batch', choices=['threaded', 'batch'])
+    parser.add_argument('--iterations', type=int, default=None)
+    parser.add_argument('--symmetric', action='store_true')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'])
+    parser.add_argument('--delta-dtype', default=None, choices=['auto', 'uint16', 'int32', 'float32', 'float64'])
+    parser.add_argument('--local-search', action='store_true')
+    parser.add_argument('--cluster-optimization', default=None, choices=['end', 'iteration'])
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    params = {'engine': args.engine, 'num_iterations': args.iterations, 'symmetric': args.symmetric, 'dtype': args.dtype,
+              'delta_dtype': args.delta_dtype}
+    if args.local_search:
+        params['local_search'] = LocalSearch()
+    if args.cluster_optimization is not None:
+        params['cluster_optimization'] = ClusterOptimizer(every_iteration=args.cluster_optimization == 'iteration')
+    run_benchmark(args.instances, args.instance_dir, args.solution_dir, args.repetitions, args.seed, args.target, params, args.output)
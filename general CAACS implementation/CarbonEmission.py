@@ -0,0 +1,83 @@
+import math
+import random
+import numpy as np
+
+# define constants for LDV, MDV and HDV
+# assume the LDV constants
+fuel_to_air = (1, 1, 1)
+gravitational_constant = (9.81, 9.81, 9.81)
+air_density = (1.2041, 1.2041, 1.2041)
+coef_rolling = (0.01, 0.01, 0.01)
+diesel_engine_efficiency = (0.45, 0.45, 0.45)
+heating_value_diesel = (44, 44, 44)
+vehicle_speed = (22.2, 22.2, 22.2)
+conversion_factor = (737, 737, 737)
+road_angle = (0, 0, 0)
+kerb_weight = (3500, 5500, 13154)
+max_payload = (4000, 12500, 17236)
+engine_friction_factor = (0.25, 0.20, 0.15)
+engine_speed = (38.3, 36.7, 30.2)
+engine_displacement = (4.50, 6.90, 6.66)
+aero_drag = (0.6, 0.7, 0.7)
+frontal_SA = (7.0, 8.0, 9.8)
+vehicle_drive_eff = (0.45, 0.45, 0.50)
+u = 2.63
+# supposedly nonconstant stuff
+speed_ij = (38, 38, 38) # randomly select from 11 to 38
+# weight carried by the car
+F_ijkpt = (200, 300, 400)
+
+# vehicle_type is 0, 1, 2 for LDV, MDV and HDV
+def vehicle_constants(vehicle_type):
+    lambda_s = fuel_to_air[vehicle_type]/(heating_value_diesel[vehicle_type]*conversion_factor[vehicle_type])
+    s = gravitational_constant[vehicle_type] * (math.sin(road_angle[vehicle_type]) + coef_rolling[vehicle_type]*math.cos(road_angle[vehicle_type]))
+    gamma_k = 1/(1000*diesel_engine_efficiency[vehicle_type]*vehicle_drive_eff[vehicle_type])
+    beta_k = 0.5*aero_drag[vehicle_type]*air_density[vehicle_type]*frontal_SA[vehicle_type]
+    y_k = engine_friction_factor[vehicle_type] * engine_speed[vehicle_type] * engine_displacement[vehicle_type]
+    return lambda_s, s, gamma_k, beta_k, y_k
+
+def create_carbon_emission(distance, vehicle_type=1):
+    lambda_s, s, gamma_k, beta_k, y_k = vehicle_constants(vehicle_type)
+
+    new_speed_ij = random.randint(11, 38)
+    engine_module = (lambda_s * y_k * distance)/new_speed_ij
+    speed_module = lambda_s*gamma_k*beta_k*distance*(speed_ij[vehicle_type]**2)
+    weight_module = lambda_s * gamma_k * s * distance * (kerb_weight[vehicle_type] + F_ijkpt[vehicle_type])
+
+    carbon_emission = (engine_module + speed_module + weight_module) * u
+
+    return (carbon_emission)
+
+# whole-matrix version of create_carbon_emission for several vehicle classes at
+# once, stacked along the first axis in the order of vehicle_types. Every edge
+# gets one speed from rng (shared by all classes), so a seeded generator
+# reproduces the matrices. delta_mat can have any shape, e.g. the packed pairs
+# of a symmetric matrix (one speed per pair, see PackedMatrix.py).
+def carbon_emissions(delta_mat, rng=None, vehicle_types=(0, 1, 2)):
+    if rng is None:
+        rng = np.random.default_rng()
+    distance = np.asarray(delta_mat, dtype=np.float64)
+
+    types = list(vehicle_types)
+    per_class = (len(types),) + (1,) * distance.ndim
+    lambda_s, s, gamma_k, beta_k, y_k = [values.reshape(per_class) for values in np.array([vehicle_constants(k) for k in types]).T]
+    squared_speed = (np.array(speed_ij, dtype=np.float64)[types] ** 2).reshape(per_class)
+    weight = (np.array(kerb_weight, dtype=np.float64)[types] + np.array(F_ijkpt, dtype=np.float64)[types]).reshape(per_class)
+
+    new_speed_ij = rng.integers(11, 39, size=distance.shape)
+
+    # per unit distance factor of each module, then one multiply by the matrix
+    engine_module = lambda_s * y_k * (distance / new_speed_ij)
+    per_distance = lambda_s * gamma_k * (beta_k * squared_speed + s * weight)
+    return (engine_module + per_distance * distance) * u
+
+# scaled = scalar**(1 - carbon/max_carbon), max_carbon broadcasts per class
+def scale_emissions(carbon, scalar, max_carbon):
+    return np.power(float(scalar), 1 - carbon / max_carbon)
+
+# returns (carbon, scaled) for every class in vehicle_types, each class scaled
+# by its own maximum
+def build_emission_matrices(delta_mat, rng=None, scalar=60, vehicle_types=(0, 1, 2)):
+    carbon = carbon_emissions(delta_mat, rng, vehicle_types)
+    max_carbon = carbon.max(axis=tuple(range(1, carbon.ndim)), keepdims=True)
+    return carbon, scale_emissions(carbon, scalar, max_carbon)
@@ -0,0 +1,79 @@
+import numpy as np
+from LocalSearch import objective_matrix
+from TourMetrics import tour_cost, block
+
+# Cluster optimization: a GTSP tour is a cluster order plus one node per
+# cluster, and for a fixed order the best nodes are a shortest path through
+# the layers of cluster members. optimize_nodes solves it exactly by dynamic
+# programming, one (start x previous x next) array per consecutive cluster
+# pair, in O(s0 * sum of s_k * s_k+1) for cluster sizes s_k; the tour is
+# rotated to start at its smallest cluster s0 since the cycle has to be
+# closed once per start node.
+#
+# A colony runs it on the top_k tours of every iteration (every_iteration,
+# after any LocalSearch) or only once on the final best tour, see
+# AntColony.improve_tours and AntColony.finish_tours. The objective is cost +
+# carbon_weight * scaled carbon (LocalSearch.objective_matrix), by default both
+# counted alike.
+
+CARBON_WEIGHT = 1.0
+
+class ClusterOptimizer:
+    def __init__(self, every_iteration=False, top_k=1, carbon_weight=CARBON_WEIGHT):
+        self.every_iteration = every_iteration
+        self.top_k = max(1, int(top_k))
+        self.carbon_weight = carbon_weight
+        self.invalidate()
+
+    # same caching as LocalSearch
+    def invalidate(self):
+        self.graph = None
+        self.weight = None
+
+    def prepare(self, graph):
+        if self.graph is graph and len(self.weight) == graph.num_nodes:
+            return
+        self.graph = graph
+        self.weight = objective_matrix(graph, self.carbon_weight)
+
+    # objective of a closed tour, after improve or prepare
+    def objective(self, path_vec):
+        return tour_cost(self.weight, path_vec)
+
+    # the tour with the same cluster order and the best node of every cluster
+    def improve(self, graph, path_vec):
+        self.prepare(graph)
+        order = graph.cluster_of[np.asarray(path_vec, dtype=np.int64)]
+        return optimize_nodes(self.weight, graph.cluster_offsets, graph.cluster_members, order).tolist()
+
+# best node per cluster for the closed cluster sequence order
+def optimize_nodes(weight, cluster_offsets, cluster_members, order):
+    order = np.asarray(order, dtype=np.int64)
+    sizes = cluster_offsets[order + 1] - cluster_offsets[order]
+    shift = int(np.argmin(sizes))
+    order = np.roll(order, -shift)
+    layers = [cluster_members[cluster_offsets[c]:cluster_offsets[c + 1]] for c in order]
+    if len(layers) == 1:
+        return np.roll(layers[0][:1], shift)
+
+    # cost[a, j]: cheapest path from start node a to node j of the current layer
+    first = layers[0]
+    cost = block(weight, first, layers[1])
+    choices = []
+    for prev_layer, layer in zip(layers[1:-1], layers[2:]):
+        total = cost[:, :, np.newaxis] + block(weight, prev_layer, layer)[np.newaxis, :, :]
+        best = np.argmin(total, axis=1)
+        choices.append(best)
+        cost = np.take_along_axis(total, best[:, np.newaxis, :], axis=1)[:, 0, :]
+
+    # close the cycle back to the start node
+    cost = cost + block(weight, layers[-1], first).T
+    start, j = np.unravel_index(int(np.argmin(cost)), cost.shape)
+    index = [j]
+    for best in reversed(choices):
+        index.append(best[start, index[-1]])
+    index.append(start)
+    index.reverse()
+
+    tour = np.array([layer[k] for layer, k in zip(layers, index)], dtype=np.int64)
+    return np.roll(tour, shift)
@@ -0,0 +1,167 @@
+import argparse
+import csv
+import os
+import numpy as np
+import AntGTSP
+from AntGraph import check_dtype
+from GTSPInstance import GTSPInstance
+
+# GTSP instances built in memory from node coordinates, e.g. the delivery
+# routes (CSV files with LATITUDE, LONGITUDE and an optional cluster column)
+# and the road network position files ("id lat lon" per line, longitude west
+# positive). Distances are rounded to integers like the text instances and are
+# computed in blocks of rows so the float64 intermediates stay at
+# chunk_rows x n; the finished matrix is passed to the solver directly instead
+# of going through the text matrix format.
+#
+#   instance = build_instance('ups', lat, lon, num_clusters=8, seed=1)
+#   AntGTSP.solve(None, None, instance=instance, engine='batch')
+
+EARTH_RADIUS_M = 6371000.0
+CHUNK_ROWS = 256
+METRICS = ('haversine', 'euclidean')
+
+# great-circle distances between all points, in meters for the default radius
+def haversine_distances(lat, lon, radius=EARTH_RADIUS_M, chunk_rows=CHUNK_ROWS, dtype=np.int32):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    distances = np.empty((len(lat), len(lat)), dtype=dtype)
+    for start in range(0, len(lat), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        a = (np.sin((lat[rows, np.newaxis] - lat[np.newaxis, :]) / 2) ** 2
+             + cos_lat[rows, np.newaxis] * cos_lat[np.newaxis, :] * np.sin((lon[rows, np.newaxis] - lon[np.newaxis, :]) / 2) ** 2)
+        # rounding can push a slightly above 1 for antipodal points
+        block = np.rint(2 * radius * np.arcsin(np.sqrt(np.minimum(a, 1.0))))
+        check_dtype(block, dtype, 'distances')
+        distances[rows] = block
+    return distances
+
+# planar distances between all points, scale converts to the integer unit
+def euclidean_distances(x, y, scale=1.0, chunk_rows=CHUNK_ROWS, dtype=np.int32):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    distances = np.empty((len(x), len(x)), dtype=dtype)
+    for start in range(0, len(x), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        block = np.hypot(x[rows, np.newaxis] - x[np.newaxis, :], y[rows, np.newaxis] - y[np.newaxis, :])
+        block = np.rint(block * scale)
+        # a large scale would overflow the integer cast silently
+        check_dtype(block, dtype, 'distances')
+        distances[rows] = block
+    return distances
+
+# latitude, longitude and (when cluster_column is given) cluster labels of a
+# CSV file, one node per row in file order
+def read_csv_points(path, lat_column='LATITUDE', lon_column='LONGITUDE', cluster_column=None):
+    lat = []
+    lon = []
+    labels = []
+    with open(path, 'r', encoding='iso-8859-1', newline='') as f:
+        for row in csv.DictReader(f):
+            lat.append(float(row[lat_column]))
+            lon.append(float(row[lon_column]))
+            if cluster_column is not None:
+                labels.append(row[cluster_column].strip())
+    return np.array(lat), np.array(lon), (labels if cluster_column is not None else None)
+
+# latitude and longitude of a positions file; its longitudes count west as
+# positive, they are returned with the usual sign (east positive)
+def read_positions(path):
+    values = np.loadtxt(path, dtype=np.float64, ndmin=2)
+    return values[:, 1], -values[:, 2]
+
+# k-means with k-means++ seeding, returns one label in 0..num_clusters-1 per
+# point; a seed makes the clusters reproducible
+def kmeans_clusters(points, num_clusters, seed=None, max_iterations=100):
+    points = np.asarray(points, dtype=np.float64)
+    if not 0 < num_clusters <= len(points):
+        raise Exception("cannot form %s clusters from %s points" % (num_clusters, len(points)))
+    rng = np.random.default_rng(seed)
+
+    centers = np.empty((num_clusters, points.shape[1]))
+    centers[0] = points[rng.integers(len(points))]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for k in range(1, num_clusters):
+        # next center drawn with probability proportional to the squared
+        # distance to the nearest center so far
+        total = closest.sum()
+        i = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers[k] = points[i]
+        closest = np.minimum(closest, ((points - centers[k]) ** 2).sum(axis=1))
+
+    labels = None
+    for iteration in range(max_iterations):
+        squared = ((points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+        new_labels = np.argmin(squared, axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for k in range(num_clusters):
+            members = labels == k
+            if members.any():
+                centers[k] = points[members].mean(axis=0)
+            else:
+                # an empty cluster takes the point farthest from its center
+                far = int(np.argmax(squared[np.arange(len(points)), labels]))
+                centers[k] = points[far]
+                labels[far] = k
+    return labels
+
+# GTSP instance of the points (lat, lon); clusters gives a label per point
+# (any hashable values, numbered in sorted order), otherwise num_clusters
+# clusters are formed with kmeans_clusters. With metric='euclidean' lat and
+# lon are used as planar y and x, scaled by scale.
+def build_instance(name, lat, lon, clusters=None, num_clusters=None, metric='haversine', seed=None, scale=1.0,
+                   chunk_rows=CHUNK_ROWS):
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) != len(lon):
+        raise Exception("%s latitudes for %s longitudes" % (len(lat), len(lon)))
+    if metric not in METRICS:
+        raise Exception("unknown metric: " + str(metric))
+
+    # planar layout for the pictures and the clustering, longitudes shrunk
+    # toward the poles so that distances in it roughly match the sphere
+    if metric == 'haversine':
+        positions = np.column_stack((lon * np.cos(np.radians(lat.mean())), lat))
+        delta_mat = haversine_distances(lat, lon, chunk_rows=chunk_rows)
+    else:
+        positions = np.column_stack((lon, lat))
+        delta_mat = euclidean_distances(lon, lat, scale, chunk_rows)
+
+    if clusters is None:
+        if num_clusters is None:
+            raise Exception("either clusters or num_clusters is required")
+        labels = kmeans_clusters(positions, num_clusters, seed)
+    else:
+        if len(clusters) != len(lat):
+            raise Exception("%s cluster labels for %s points" % (len(clusters), len(lat)))
+        labels = np.unique(np.asarray(clusters), return_inverse=True)[1].reshape(-1)
+
+    # CSR layout of GTSPInstance, nodes keep their order within a cluster
+    cluster_members = np.argsort(labels, kind='stable').astype(np.int64)
+    cluster_offsets = np.concatenate(([0], np.cumsum(np.bincount(labels)))).astype(np.int64)
+    return GTSPInstance(name, len(lat), cluster_offsets, cluster_members, delta_mat, symmetric=True, positions=positions)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Solve a GTSP instance built from node coordinates.')
+    parser.add_argument('points', help='CSV file with coordinate columns or an "id lat lon" positions file')
+    parser.add_argument('--cluster-column', default=None)
+    parser.add_argument('--clusters', type=int, default=None, help='number of k-means clusters when there is no cluster column')
+    parser.add_argument('--metric', default='haversine', choices=METRICS)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--engine', default='batch', choices=['threaded', 'batch'])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--symmetric', action='store_true')
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.points))[0]
+    if args.points.endswith('.csv'):
+        lat, lon, labels = read_csv_points(args.points, cluster_column=args.cluster_column)
+    else:
+        lat, lon = read_positions(args.points)
+        labels = None
+    instance = build_instance(name, lat, lon, labels, args.clusters, args.metric, args.seed, args.scale)
+    print ("%s: %s nodes in %s clusters" % (name, instance.num_nodes, instance.num_clusters))
+    AntGTSP.solve(None, None, engine=args.engine, seed=args.seed, create_images=False, symmetric=args.symmetric, instance=instance)
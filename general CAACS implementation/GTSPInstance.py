@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# parsed instances are cached as one binary file per (instance, content hash):
+#   8 byte magic | 8 byte header length | JSON header | 64-byte aligned arrays
+# so later loads memory-map the arrays instead of parsing the text again
+CACHE_DIR = './gtsp_cache/'
+CACHE_MAGIC = b'GTSPC001'
+CACHE_ALIGN = 64
+
+class GTSPInstance:
+    def __init__(self, name, num_nodes, cluster_offsets, cluster_members, delta_mat, symmetric=False, triangle=False, source_hash=None,
+                 positions=None):
+        self.name = name
+        self.num_nodes = num_nodes
+        self.num_clusters = len(cluster_offsets) - 1
+        self.cluster_offsets = cluster_offsets
+        self.cluster_members = cluster_members
+        self.delta_mat = delta_mat
+        self.symmetric = symmetric
+        self.triangle = triangle
+        self.source_hash = source_hash
+        # 2-D node layout for create_image when the instance comes from
+        # coordinates (see CoordinateInstance.py), None for the text format
+        self.positions = positions
+
+        # list of node lists, the layout AntGraph expects
+        self.clusters_mat = [cluster_members[cluster_offsets[i]:cluster_offsets[i + 1]].tolist() for i in range(self.num_clusters)]
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# parse the text format: N, M, Symmetric and Triangle header lines, one line per
+# cluster (size followed by 1-indexed nodes) and the distance matrix
+def parse_instance(path, name=None, source_hash=None):
+    f = open(path, 'r', encoding='iso-8859-1')
+
+    num_nodes = int(f.readline().strip().split()[1])
+    num_clusters = int(f.readline().strip().split()[1])
+    symmetric = f.readline().strip().split()[-1].lower() == 'true'
+    triangle = f.readline().strip().split()[-1].lower() == 'true'
+
+    members = []
+    offsets = [0]
+    for i in range(num_clusters):
+        clusters_list = f.readline().strip().split()
+        members.extend(int(val) - 1 for val in clusters_list[1:]) # reindex 1-n to 0-(n-1)
+        offsets.append(len(members))
+
+    # the matrix ends at the first empty line
+    lines = []
+    for line in f:
+        if not line.strip():
+            break
+        lines.append(line)
+    f.close()
+
+    num_cols = len(lines[0].split())
+    values = np.fromstring(''.join(lines), dtype=np.int64, sep=' ')
+    delta_mat = values.reshape(-1, num_cols)[:num_nodes, :num_nodes]
+    if delta_mat.min() >= np.iinfo(np.int32).min and delta_mat.max() <= np.iinfo(np.int32).max:
+        delta_mat = delta_mat.astype(np.int32)
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    return GTSPInstance(name, num_nodes, np.array(offsets, dtype=np.int64), np.array(members, dtype=np.int64),
+                        np.ascontiguousarray(delta_mat), symmetric, triangle, source_hash)
+
+def write_cache(instance, cache_path):
+    arrays = {
+        'cluster_offsets': np.ascontiguousarray(instance.cluster_offsets),
+        'cluster_members': np.ascontiguousarray(instance.cluster_members),
+        'delta_mat': np.ascontiguousarray(instance.delta_mat),
+    }
+    header = {
+        'name': instance.name,
+        'num_nodes': instance.num_nodes,
+        'symmetric': instance.symmetric,
+        'triangle': instance.triangle,
+        'source_hash': instance.source_hash,
+        'arrays': {},
+    }
+
+    # array offsets depend on the header length, so lay the arrays out after
+    # a header that is padded generously enough to hold its own offsets
+    header_bytes = json.dumps(header).encode('utf-8')
+    start = align(len(CACHE_MAGIC) + 8 + len(header_bytes) + 256 * len(arrays))
+    offset = start
+    for key, array in arrays.items():
+        header['arrays'][key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    if len(CACHE_MAGIC) + 8 + len(header_bytes) > start:
+        raise Exception("cache header too large")
+
+    # write to a temporary file first so that readers never see a partial cache
+    temp_path = cache_path + '.%d.tmp' % (os.getpid(),)
+    with open(temp_path, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for key, array in arrays.items():
+            f.seek(header['arrays'][key]['offset'])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(temp_path, cache_path)
+
+def read_cache(cache_path):
+    with open(cache_path, 'rb') as f:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            raise Exception("not a GTSP cache file: " + cache_path)
+        header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_len).decode('utf-8'))
+
+    arrays = {}
+    for key, spec in header['arrays'].items():
+        if int(np.prod(spec['shape'])) == 0:
+            arrays[key] = np.zeros(spec['shape'], dtype=np.dtype(spec['dtype']))
+        else:
+            arrays[key] = np.memmap(cache_path, dtype=np.dtype(spec['dtype']), mode='r', offset=spec['offset'], shape=tuple(spec['shape']))
+
+    return GTSPInstance(header['name'], header['num_nodes'], np.asarray(arrays['cluster_offsets']), np.asarray(arrays['cluster_members']),
+                        arrays['delta_mat'], header['symmetric'], header['triangle'], header['source_hash'])
+
+def align(offset):
+    return (offset + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+
+# load an instance through the cache, the cache file name carries the content
+# hash of the text file so an edited instance is parsed again
+def load_instance(path, cache_dir=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(path))[0]
+    source_hash = file_hash(path)
+    if cache_dir is None:
+        return parse_instance(path, name, source_hash)
+
+    cache_path = os.path.join(cache_dir, '%s-%s.gtspc' % (name, source_hash[:16]))
+    if os.path.exists(cache_path):
+        instance = read_cache(cache_path)
+        if instance.source_hash == source_hash:
+            return instance
+
+    instance = parse_instance(path, name, source_hash)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    write_cache(instance, cache_path)
+    return instance
+
+# reference solution files: number of clusters, cost, then one 1-indexed node
+# per line; returns the cost and the 0-indexed tour
+def read_reference_solution(path):
+    with open(path, 'r') as f:
+        values = [int(line) for line in f if line.strip()]
+    num_clusters, cost = values[0], values[1]
+    tour = [node - 1 for node in values[2:2 + num_clusters]]
+    return cost, tour
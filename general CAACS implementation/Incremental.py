@@ -0,0 +1,194 @@
+import numpy as np
+import AntGTSP
+from AntGraph import check_dtype
+from CarbonEmission import carbon_emissions, scale_emissions
+from TourMetrics import tour_cost
+
+# Incremental changes to the graph of a running (or finished) colony: nodes
+# are added, removed or moved between clusters without rebuilding the graph,
+# the best tour is repaired locally and the colony picks up from there with
+# colony.start(resume=True), which runs num_iterations (or extra_iterations)
+# more iterations. Work is O(n) per changed node (its row and column), not
+# O(n^2) per change.
+#
+# Distances of added nodes are given per new node i:
+#   distances_out[i][j]  from new node i to existing node j (j < graph.num_nodes)
+#   distances_in[i][j]   from existing node j to new node i
+#   distances_new[i][k]  from new node i to new node k
+# Carbon and scaled emissions of the new edges are built like the original
+# matrices (CarbonEmission.py); scaled values use the graph's current maximum
+# carbon as normalizer so the existing edges keep their values.
+
+# add nodes with the given cluster ids; an id equal to graph.num_clusters (or
+# the next ones, in order) opens a new cluster. Returns the node ids, freed
+# slots of removed nodes are reused first.
+def add_nodes(colony, distances_out, distances_in, clusters, distances_new=None, positions=None, rng=None, vehicle_type=1,
+              scalar=None):
+    graph = colony.graph
+    if scalar is None:
+        scalar = AntGTSP.scalar
+    if rng is None:
+        rng = np.random.default_rng()
+
+    distances_out = np.asarray(distances_out, dtype=np.float64)
+    distances_in = np.asarray(distances_in, dtype=np.float64)
+    count = len(clusters)
+    if distances_new is None:
+        if count > 1:
+            raise Exception("distances_new is required when adding more than one node")
+        distances_new = np.zeros((count, count))
+    distances_new = np.asarray(distances_new, dtype=np.float64)
+    old_num_nodes = graph.num_nodes
+    if distances_out.shape != (count, old_num_nodes) or distances_in.shape != (count, old_num_nodes):
+        raise Exception("distances of added nodes must be %s x %s" % (count, old_num_nodes))
+    if graph.symmetric and not (np.array_equal(distances_out, distances_in) and np.array_equal(distances_new, distances_new.T)):
+        raise Exception("a symmetric graph needs symmetric distances")
+    if graph.vectorized:
+        # checked before any slot is taken
+        for distances in (distances_out, distances_in, distances_new):
+            check_dtype(distances, graph.delta_mat.dtype, 'delta_mat')
+
+    max_carbon = graph.carbon_max()
+    nodes = graph.allocate_nodes(count)
+    ids = np.asarray(nodes, dtype=np.int64)
+
+    rows = np.zeros((count, graph.num_nodes))
+    rows[:, :old_num_nodes] = distances_out
+    rows[:, ids] = distances_new
+    cols = np.zeros((graph.num_nodes, count))
+    cols[:old_num_nodes, :] = distances_in.T
+    cols[ids, :] = distances_new
+
+    carbon_rows = carbon_emissions(rows, rng, (vehicle_type,))[0]
+    if graph.symmetric:
+        # one speed per pair
+        carbon_cols = carbon_rows.T
+    else:
+        carbon_cols = carbon_emissions(cols, rng, (vehicle_type,))[0]
+        # the new-to-new cells are written by both, keep one value for them
+        carbon_cols[ids, :] = carbon_rows[:, ids]
+    for name, row_values, col_values in (('delta_mat', rows, cols), ('carbon_mat', carbon_rows, carbon_cols),
+                                          ('scaled_mat', scale_emissions(carbon_rows, scalar, max_carbon),
+                                           scale_emissions(carbon_cols, scalar, max_carbon))):
+        if not graph.vectorized:
+            row_values = row_values.tolist()
+            col_values = col_values.tolist()
+        graph.set_edges(name, nodes, row_values, col_values)
+    if graph.vectorized:
+        graph.refresh_attractiveness(nodes)
+
+    clusters_mat = graph.clusters_mat
+    for node, c in zip(nodes, clusters):
+        if c == len(clusters_mat):
+            clusters_mat.append([])
+        elif c > len(clusters_mat) or c < 0:
+            raise Exception("cluster id %s out of range" % (c,))
+        clusters_mat[c].append(node)
+    graph.set_clusters(clusters_mat)
+
+    update_positions(graph, nodes, positions)
+    repair(colony, nodes)
+    return nodes
+
+# remove nodes; a cluster left without nodes is removed as well and the
+# clusters after it are renumbered
+def remove_nodes(colony, nodes):
+    graph = colony.graph
+    removed = set(int(node) for node in nodes)
+    clusters_mat = [[node for node in cluster if node not in removed] for cluster in graph.clusters_mat]
+    graph.set_clusters([cluster for cluster in clusters_mat if cluster])
+    graph.free_nodes = sorted(set(graph.free_nodes) | removed)
+    repair(colony)
+
+# move nodes to other clusters (same numbering rules as add_nodes)
+def move_nodes(colony, nodes, clusters):
+    graph = colony.graph
+    moved = dict(zip((int(node) for node in nodes), clusters))
+    clusters_mat = [[node for node in cluster if node not in moved] for cluster in graph.clusters_mat]
+    for node, c in moved.items():
+        if c == len(clusters_mat):
+            clusters_mat.append([])
+        elif c > len(clusters_mat) or c < 0:
+            raise Exception("cluster id %s out of range" % (c,))
+        clusters_mat[c].append(node)
+
+    # renumbering after emptied clusters happens once all moves are in
+    graph.set_clusters([cluster for cluster in clusters_mat if cluster])
+    repair(colony, list(moved))
+
+def remove_cluster(colony, c):
+    remove_nodes(colony, list(colony.graph.clusters_mat[c]))
+
+# positions of new nodes when the graph has a layout, otherwise the layout is
+# computed again on first use
+def update_positions(graph, nodes, positions):
+    if graph._positions is None:
+        return
+    if positions is None:
+        graph.positions = None
+        return
+    for node, (x, y) in zip(nodes, positions):
+        graph._positions[node] = (float(x), float(y))
+
+# make the colony's best tour valid again and let it continue from there:
+# nodes that left every cluster (or whose cluster is already visited) are
+# dropped, clusters missing from the tour get their cheapest insertion, and a
+# changed node replaces its cluster's node in the tour if that is cheaper
+def repair(colony, changed_nodes=()):
+    colony.graph.objectives.clear()
+    for stage in (colony.local_search, colony.cluster_optimization):
+        if stage is not None:
+            stage.invalidate()
+    if colony.best_path_vec is None:
+        return
+    graph = colony.graph
+    tour = repair_tour(graph, colony.best_path_vec, changed_nodes)
+    colony.record_best(tour, tour_cost(graph.delta_mat, tour))
+
+def repair_tour(graph, path_vec, changed_nodes=()):
+    tour = []
+    visited = set()
+    for node in path_vec:
+        c = graph.get_cluster(node)
+        if c < 0 or c in visited:
+            continue
+        visited.add(c)
+        tour.append(int(node))
+
+    for c in range(graph.num_clusters):
+        if c not in visited:
+            insert_cheapest(graph, tour, graph.get_members(c))
+
+    position = dict((graph.get_cluster(node), i) for i, node in enumerate(tour))
+    for node in changed_nodes:
+        c = graph.get_cluster(node)
+        if c < 0 or len(tour) < 2:
+            continue
+        i = position[c]
+        prev_node, next_node = tour[i - 1], tour[(i + 1) % len(tour)]
+        current = graph.delta(prev_node, tour[i]) + graph.delta(tour[i], next_node)
+        if graph.delta(prev_node, node) + graph.delta(node, next_node) < current:
+            tour[i] = int(node)
+    return tour
+
+# insert the member of a cluster at the position that adds the least distance
+def insert_cheapest(graph, tour, members):
+    members = [int(node) for node in members]
+    if not tour:
+        tour.append(members[0])
+        return
+
+    best = None
+    for i in range(len(tour)):
+        prev_node, next_node = tour[i], tour[(i + 1) % len(tour)]
+        if graph.vectorized:
+            # in float64, compact integer distances would wrap around
+            added = graph.delta_mat[prev_node, members].astype(np.float64) + graph.delta_mat[members, next_node] - graph.delta(prev_node, next_node)
+            k = int(np.argmin(added))
+            candidate = (float(added[k]), i, members[k])
+        else:
+            candidate = min((graph.delta(prev_node, node) + graph.delta(node, next_node) - graph.delta(prev_node, next_node), i, node)
+                            for node in members)
+        if best is None or candidate[0] < best[0]:
+            best = candidate
+    tour.insert(best[1] + 1, best[2])
@@ -0,0 +1,172 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import AntGTSP
+from AntGraph import AntGraph
+from BatchAntColony import BatchAntColony
+from GTSPInstance import CACHE_DIR
+
+# Island model: K BatchAntColony instances run in separate processes, each with
+# its own pheromone matrix. Every migration_interval iterations an island sends
+# its best tour to its neighbours (ring: the next island, full: every other
+# island), adopts a received tour that beats its own best and, with blend,
+# deposits pheromone along every received tour.
+
+TOPOLOGIES = ('ring', 'full')
+# how long a queue read waits before checking that the other processes are alive
+POLL_SECONDS = 1.0
+
+def neighbours(k, num_islands, topology):
+    if topology == 'ring':
+        return [(k + 1) % num_islands] if num_islands > 1 else []
+    if topology == 'full':
+        return [j for j in range(num_islands) if j != k]
+    raise Exception("unknown topology: " + str(topology))
+
+# deposit along an immigrant tour with the global update's rule (evaporation
+# restricted to the tour's edges) and keep the tour if it beats our best
+def receive_tour(colony, path_vec, path_cost, blend=True):
+    if blend:
+        colony.deposit_tour(path_vec, path_cost)
+
+    if path_cost < colony.best_path_cost:
+        colony.record_best(list(path_vec), path_cost)
+
+# the next immigrant tour; gives up when the run was aborted (another island
+# failed) or the parent process is gone
+def receive_migrant(inbox, abort):
+    while True:
+        try:
+            return inbox.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+        if abort.is_set():
+            raise Exception("run aborted while waiting for migrants")
+        parent = multiprocessing.parent_process()
+        if parent is not None and not parent.is_alive():
+            raise Exception("parent process exited while waiting for migrants")
+
+def island_worker(k, handle, num_iterations, migration_interval, topology, blend, seed, inboxes, results, abort):
+    graph = None
+    try:
+        num_islands = len(inboxes)
+        # the matrices live in shared memory, only tau is private to the island
+        graph = AntGraph.attach_shared(handle)
+        graph.reset_tau()
+        colony = BatchAntColony(graph, graph.num_ants, num_iterations, seed=seed)
+        colony.iter_counter = 0
+
+        targets = neighbours(k, num_islands, topology)
+        num_senders = sum(1 for j in range(num_islands) if k in neighbours(j, num_islands, topology))
+
+        while colony.iter_counter < num_iterations:
+            colony.step()
+            if colony.iter_counter % migration_interval == 0 and colony.iter_counter < num_iterations:
+                for j in targets:
+                    inboxes[j].put((colony.best_path_vec, colony.best_path_cost))
+                for i in range(num_senders):
+                    path_vec, path_cost = receive_migrant(inboxes[k], abort)
+                    receive_tour(colony, path_vec, path_cost, blend)
+
+        results.put((k, colony.best_path_vec, colony.best_path_cost, colony.iter_counter, None))
+    except Exception as e:
+        # the islands waiting for our tours would otherwise wait forever
+        abort.set()
+        results.put((k, None, None, None, repr(e)))
+    finally:
+        if graph is not None:
+            graph.release_shared()
+
+# the next island result; an island that exited without sending one fails the run
+def next_result(results, workers, reported):
+    while True:
+        try:
+            return results.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+        dead = [k for k, worker in enumerate(workers) if k not in reported and not worker.is_alive()]
+        if dead:
+            # a result put right before the island exited may still be on its way
+            try:
+                return results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                raise Exception("island %s died with exit code %s" % (dead[0], workers[dead[0]].exitcode))
+
+# same return value as AntGTSP.solve: best path, its cost, its carbon cost and
+# the number of iterations each island ran
+def solve_islands(file_path, input_file, num_islands=None, migration_interval=10, topology='ring', blend=True,
+                  seed=None, num_iterations=None, cache_dir=CACHE_DIR, vehicle_type=1, symmetric=False, dtype='float64', delta_dtype=None):
+    if num_islands is None:
+        num_islands = os.cpu_count() or 1
+    if topology not in TOPOLOGIES:
+        raise Exception("unknown topology: " + str(topology))
+
+    # every island works on the same emission matrices
+    graph = AntGTSP.build_graph(file_path, input_file, True, seed, cache_dir, vehicle_type, symmetric=symmetric, dtype=dtype,
+                                delta_dtype=delta_dtype)
+    num_ants, default_iterations, num_repetitions = AntGTSP.default_parameters(graph.num_nodes)
+    if num_iterations is None:
+        num_iterations = default_iterations
+    handle = graph.publish_shared()
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for k in range(num_islands)]
+    results = context.Queue()
+    abort = context.Event()
+    workers = []
+    for k in range(num_islands):
+        island_seed = None if seed is None else seed + k + 1
+        worker = context.Process(target=island_worker, args=(k, handle, num_iterations, migration_interval, topology, blend, island_seed,
+                                                             inboxes, results, abort))
+        worker.start()
+        workers.append(worker)
+
+    try:
+        best_path_vec = None
+        best_path_cost = sys.maxsize
+        iter_counter = 0
+        reported = set()
+        while len(reported) < num_islands:
+            island, path_vec, path_cost, island_iterations, error = next_result(results, workers, reported)
+            reported.add(island)
+            if error is not None:
+                raise Exception("island %s failed: %s" % (island, error))
+            iter_counter = max(iter_counter, island_iterations)
+            if path_cost < best_path_cost:
+                best_path_cost = path_cost
+                best_path_vec = path_vec
+    finally:
+        abort.set()
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        c_cost = None if best_path_vec is None else graph.carbon_cost(best_path_vec, graph.carbon_mat)
+        graph.release_shared()
+
+    return best_path_vec, best_path_cost, c_cost, iter_counter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Solve one instance with an island model of ant colonies.')
+    parser.add_argument('instance')
+    parser.add_argument('--islands', type=int, default=None)
+    parser.add_argument('--migration-interval', type=int, default=10)
+    parser.add_argument('--topology', default='ring', choices=TOPOLOGIES)
+    parser.add_argument('--no-blend', action='store_true')
+    parser.add_argument('--iterations', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--symmetric', action='store_true')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'])
+    parser.add_argument('--delta-dtype', default=None, choices=['auto', 'uint16', 'int32', 'float32', 'float64'])
+    args = parser.parse_args()
+
+    file_path, input_file = os.path.split(args.instance)
+    best_path_vec, best_path_cost, c_cost, iter_counter = solve_islands(os.path.join(file_path, ''), input_file, args.islands,
+                                                                        args.migration_interval, args.topology, not args.no_blend,
+                                                                        args.seed, args.iterations, symmetric=args.symmetric,
+                                                                        dtype=args.dtype, delta_dtype=args.delta_dtype)
+    print ("\nBest path found = %s" % (best_path_vec,))
+    print ("\nBest path cost = %s\n" % (best_path_cost,))
+    print ("\nBest path carbon cost = %s\n" % (c_cost,))
@@ -0,0 +1,231 @@
+from collections import deque
+import numpy as np
+from PackedMatrix import PackedSymmetric
+from TourMetrics import is_array, tour_cost, edge, block, prefix_sums, two_opt_delta, reselect_delta, move_segment_delta
+
+# Local search for GTSP tours, run by a colony on the best tours of every
+# iteration before the global update (see AntColony.improve_tours). A tour
+# visits one node per cluster, so every tour slot is identified by its
+# cluster; the moves are
+#   'swap'   reselect the node of a cluster (its cheapest member between the
+#            neighbouring nodes)
+#   '2opt'   reverse a segment of the tour
+#   'oropt'  move a segment of 1 to 3 clusters to another place
+# and are evaluated on the objective cost + carbon_weight * scaled carbon (see
+# objective_matrix) with the O(1) move deltas of TourMetrics.py.
+#
+# Candidate moves come from neighbor lists (the num_neighbors cheapest tour
+# nodes of each tour node, recomputed for every tour since only one member of
+# each cluster is in it) and don't-look bits: a cluster is looked at again
+# only after a move changed one of its edges.
+
+MOVES = ('swap', '2opt', 'oropt')
+OR_OPT_LENGTHS = (1, 2, 3)
+# an improvement must beat float noise in the prefix sums
+EPSILON = 1e-7
+
+class LocalSearch:
+    def __init__(self, moves=MOVES, top_k=1, carbon_weight=0.0, num_neighbors=8):
+        for move in moves:
+            if move not in MOVES:
+                raise Exception("unknown local search move: " + str(move))
+        self.moves = tuple(moves)
+        # number of the iteration's best tours that are improved
+        self.top_k = max(1, int(top_k))
+        self.carbon_weight = carbon_weight
+        self.num_neighbors = num_neighbors
+        self.invalidate()
+
+    # the objective matrix is looked up on first use (see objective_matrix);
+    # call invalidate after the graph's edges changed
+    def invalidate(self):
+        self.graph = None
+        self.weight = None
+
+    def prepare(self, graph):
+        if self.graph is graph and len(self.weight) == graph.num_nodes:
+            return
+        self.graph = graph
+        self.weight = objective_matrix(graph, self.carbon_weight)
+
+    # objective of a closed tour, after improve or prepare
+    def objective(self, path_vec):
+        return tour_cost(self.weight, path_vec)
+
+    # returns the improved tour as a list; the objective never gets worse
+    def improve(self, graph, path_vec):
+        self.prepare(graph)
+        tour = SearchTour(graph, self.weight, path_vec, self.num_neighbors)
+        if tour.size < 3:
+            return tour.nodes.tolist()
+
+        queue = deque(int(c) for c in graph.cluster_of[tour.nodes])
+        queued = np.zeros(graph.num_clusters, dtype=bool)
+        queued[list(queue)] = True
+        while queue:
+            c = queue.popleft()
+            queued[c] = False
+            for move in self.moves:
+                touched = getattr(tour, MOVE_METHODS[move])(c)
+                if touched:
+                    # the clusters at the changed edges are looked at again
+                    for other in touched:
+                        if not queued[other]:
+                            queued[other] = True
+                            queue.append(other)
+                    break
+        return tour.nodes.tolist()
+
+MOVE_METHODS = {'swap': 'swap_node', '2opt': 'two_opt', 'oropt': 'or_opt'}
+
+# cost + carbon_weight * scaled carbon of every edge, the carbon scaled to the
+# total distance (see carbon_scale) so that a weight of 1 counts both alike.
+# Without carbon it is delta_mat itself, read through the float64 gathers of
+# TourMetrics; otherwise (and for the nested lists of the list mode) a float64
+# matrix, packed for symmetric graphs, that is built once per graph and weight
+# and shared by all stages
+def objective_matrix(graph, carbon_weight=0.0):
+    if not carbon_weight and is_array(graph.delta_mat):
+        return graph.delta_mat
+    weight = graph.objectives.get(carbon_weight)
+    if weight is not None and len(weight) == graph.num_nodes:
+        return weight
+
+    if isinstance(graph.delta_mat, PackedSymmetric) and isinstance(graph.carbon_mat, PackedSymmetric):
+        data = graph.delta_mat.data.astype(np.float64)
+        data += carbon_weight * carbon_scale(graph) * graph.carbon_mat.data.astype(np.float64)
+        weight = PackedSymmetric(graph.num_nodes, data)
+    else:
+        weight = np.array(graph.delta_mat, dtype=np.float64)
+        if carbon_weight:
+            weight += carbon_weight * carbon_scale(graph) * np.asarray(graph.carbon_mat, dtype=np.float64)
+    graph.objectives[carbon_weight] = weight
+    return weight
+
+# distance per unit of carbon over all edges; the packed matrices hold each
+# edge once, which leaves the ratio unchanged
+def carbon_scale(graph):
+    delta, carbon = graph.delta_mat, graph.carbon_mat
+    if isinstance(delta, PackedSymmetric) and isinstance(carbon, PackedSymmetric):
+        delta, carbon = delta.data, carbon.data
+    total = float(np.sum(carbon, dtype=np.float64))
+    return float(np.sum(delta, dtype=np.float64)) / total if total > 0 else 0.0
+
+# a tour under local search: nodes, the tour position of each cluster and the
+# prefix sums of the forward and backward edge weights
+class SearchTour:
+    def __init__(self, graph, weight, path_vec, num_neighbors):
+        self.graph = graph
+        self.weight = weight
+        self.nodes = np.array(path_vec, dtype=np.int64)
+        self.size = len(self.nodes)
+        self.update_positions()
+
+        # neighbor lists by cluster, cheapest first; in_neighbors[c] are the
+        # clusters whose tour node has the cheapest edge into c's node
+        k = min(num_neighbors, self.size - 1)
+        self.out_neighbors = np.full((graph.num_clusters, max(k, 0)), -1, dtype=np.int64)
+        self.in_neighbors = self.out_neighbors.copy()
+        if k > 0:
+            sub = block(weight, self.nodes, self.nodes)
+            np.fill_diagonal(sub, np.inf)
+            clusters = graph.cluster_of[self.nodes]
+            for neighbors, matrix in ((self.out_neighbors, sub), (self.in_neighbors, sub.T)):
+                nearest = np.argpartition(matrix, k - 1, axis=1)[:, :k]
+                order = np.argsort(np.take_along_axis(matrix, nearest, axis=1), axis=1)
+                neighbors[clusters] = clusters[np.take_along_axis(nearest, order, axis=1)]
+
+    def update_positions(self):
+        self.position = np.full(self.graph.num_clusters, -1, dtype=np.int64)
+        self.position[self.graph.cluster_of[self.nodes]] = np.arange(self.size)
+        self.forward = None
+
+    def node(self, i):
+        return int(self.nodes[i % self.size])
+
+    def cluster(self, i):
+        return int(self.graph.cluster_of[self.nodes[i % self.size]])
+
+    # computed again only after a move
+    def prefix_sums(self):
+        if self.forward is None:
+            self.forward, self.backward = prefix_sums(self.weight, self.nodes)
+        return self.forward, self.backward
+
+    def swap_node(self, c):
+        i = self.position[c]
+        members = self.graph.get_members(c)
+        deltas = reselect_delta(self.weight, self.nodes, i, members)
+        k = int(np.argmin(deltas))
+        if deltas[k] < -EPSILON:
+            self.nodes[i] = members[k]
+            self.forward = None
+            return (self.cluster(i - 1), c, self.cluster(i + 1))
+        return None
+
+    # reverse the circular segment starting at position p with length length
+    def two_opt_delta(self, p, length):
+        forward, backward = self.prefix_sums()
+        return two_opt_delta(self.weight, self.nodes, p, length, forward, backward)
+
+    def reverse(self, p, length):
+        indices = (p + np.arange(length)) % self.size
+        self.nodes[indices] = self.nodes[indices[::-1]]
+        self.update_positions()
+        return (self.cluster(p - 1), self.cluster(p), self.cluster(p + length - 1), self.cluster(p + length))
+
+    def two_opt(self, c):
+        weight = self.weight
+        size = self.size
+        i = self.position[c]
+        node = self.node(i)
+
+        # new edge node -> neighbor, the segment after node up to the neighbor is reversed
+        current = edge(weight, node, self.node(i + 1))
+        for other in self.out_neighbors[c]:
+            j = self.position[other]
+            if edge(weight, node, self.node(j)) >= current:
+                break
+            length = (j - i) % size
+            if 2 <= length <= size - 2 and self.two_opt_delta(i + 1, length) < -EPSILON:
+                return self.reverse(i + 1, length)
+
+        # new edge neighbor -> node, the segment from the neighbor up to node's predecessor
+        current = edge(weight, self.node(i - 1), node)
+        for other in self.in_neighbors[c]:
+            j = self.position[other]
+            if edge(weight, self.node(j), node) >= current:
+                break
+            length = (i - j) % size
+            if 2 <= length <= size - 2 and self.two_opt_delta(j, length) < -EPSILON:
+                return self.reverse(j, length)
+        return None
+
+    # move the segment of length clusters starting at c after another tour node
+    def or_opt(self, c):
+        weight = self.weight
+        size = self.size
+        i = self.position[c]
+        for length in OR_OPT_LENGTHS:
+            if length > size - 3:
+                break
+            for other in self.in_neighbors[c]:
+                j = self.position[other]
+                # j must lie outside the segment and not be its predecessor
+                if (j - i) % size < length or (j - i) % size == size - 1:
+                    continue
+                if move_segment_delta(weight, self.nodes, i, length, j) < -EPSILON:
+                    return self.move_segment(i, length, j)
+        return None
+
+    def move_segment(self, i, length, j):
+        touched = (self.cluster(i - 1), self.cluster(i), self.cluster(i + length - 1), self.cluster(i + length),
+                   self.cluster(j), self.cluster(j + 1))
+        indices = (i + np.arange(length)) % self.size
+        segment = self.nodes[indices]
+        after = self.nodes[j]
+        rest = np.delete(self.nodes, indices)
+        k = int(np.flatnonzero(rest == after)[0]) + 1
+        self.nodes = np.concatenate((rest[:k], segment, rest[k:]))
+        self.update_positions()
+        return touched
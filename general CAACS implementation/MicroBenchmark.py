@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+import AntGTSP
+from Ant import Ant
+from AntColony import AntColony
+from AntGraph import AntGraph
+from BatchAntColony import BatchAntColony
+from CarbonEmission import build_emission_matrices
+from CoordinateInstance import build_instance
+from GTSPInstance import parse_instance
+from TourMetrics import batch_tour_costs, tour_cost
+
+# Timings of the solver's kernels on instances from 48 to 783 nodes, both
+# synthetic (uniform random points, clusters of about five nodes like the
+# empirical instances) and real ones. Every kernel is timed per call (best of
+# repeat samples, each of enough calls to take min_time / repeat), the
+# scaling exponent of each kernel is the slope of log(time) over log(nodes),
+# and a stored baseline file flags the kernels that got slower:
+#
+#   python MicroBenchmark.py --save-baseline         store this commit's timings
+#   python MicroBenchmark.py                         compare against them
+#
+# Kernels that need a graph run on a graph of the chosen mode (list,
+# vectorized or symmetric); create_image renders into memory, not to disk.
+# Every kernel starts from the freshly reset pheromone matrix, and the kernels
+# that change tau restore it (untimed) before every call, so repeated calls
+# never drive tau into denormal values.
+
+SIZES = (48, 100, 200, 400, 783)
+REAL_INSTANCES = ('10att48', '20kroA100', '40kroa200', '80rd400', '157rat783')
+INSTANCE_DIR = '../empirical instances/'
+BASELINE_PATH = './microbenchmark_baseline.json'
+MODES = ('list', 'vectorized', 'symmetric')
+# a kernel is reported as a regression when it is this much slower than the baseline
+TOLERANCE = 0.25
+
+def synthetic_instance(num_nodes, seed=1):
+    rng = np.random.default_rng(seed)
+    points = rng.random((num_nodes, 2)) * 1000
+    return build_instance('synthetic%d' % (num_nodes,), points[:, 1], points[:, 0], num_clusters=max(2, num_nodes // 5),
+                          metric='euclidean', seed=seed)
+
+# seconds per call; setup runs before every call and is not timed
+def time_kernel(kernel, min_time=0.2, repeat=3, setup=None):
+    def sample(number):
+        if setup is None:
+            start = time.perf_counter()
+            for i in range(number):
+                kernel()
+            return time.perf_counter() - start
+        elapsed = 0.0
+        for i in range(number):
+            setup()
+            start = time.perf_counter()
+            kernel()
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    number = 1
+    while True:
+        elapsed = sample(number)
+        if elapsed >= min_time / repeat:
+            break
+        number *= 2
+    samples = [elapsed] + [sample(number) for r in range(repeat - 1)]
+    return min(samples) / number
+
+# snapshot of the graph's pheromone matrix and a function that writes it back
+def tau_restorer(graph):
+    if graph.vectorized:
+        snapshot = graph.tau_mat.copy()
+        def restore():
+            graph.tau_mat[...] = snapshot
+    else:
+        snapshot = [list(row) for row in graph.tau_mat]
+        def restore():
+            for row, saved in zip(graph.tau_mat, snapshot):
+                row[:] = saved
+    return restore
+
+# (name, callable, setup) of every kernel for one instance and the function
+# that restores the initial tau; path is the text file of a real instance,
+# parsing is timed only for those
+def kernels(instance, path, mode, seed=1):
+    vectorized = mode != 'list'
+    symmetric = mode == 'symmetric'
+    graph = AntGTSP.build_graph(None, None, vectorized, seed, None, instance=instance, symmetric=symmetric)
+    graph.reset_tau()
+    num_ants, num_iterations, num_repetitions = AntGTSP.default_parameters(graph.num_nodes)
+    rng = np.random.default_rng(seed)
+    carbon_mats, scaled_mats = build_emission_matrices(instance.delta_mat, rng, AntGTSP.scalar, vehicle_types=(1,))
+
+    colony = AntColony(graph, num_ants, num_iterations)
+    colony.iter_counter = 0
+    tours = np.array([[int(graph.get_members(c)[0]) for c in rng.permutation(graph.num_clusters)] for i in range(num_ants)])
+    colony.best_path_vec = tours[0].tolist()
+    colony.best_path_cost = tour_cost(graph.delta_mat, colony.best_path_vec)
+    start_node = int(graph.cluster_members[0])
+    edges = rng.integers(0, graph.num_nodes, size=(64, 2)).tolist()
+
+    # every call starts a fresh Ant, built (a Thread and its masks) untimed
+    fresh = []
+    def new_ant():
+        fresh[:] = [Ant(0, start_node, colony)]
+    def state_transition_rule():
+        fresh[0].state_transition_rule(start_node)
+
+    ant = Ant(0, start_node, colony)
+    def local_updating_rule():
+        for r, s in edges:
+            ant.local_updating_rule(r, s)
+
+    # only the updated cells need their initial value back
+    initial_edges = [graph.tau(r, s) for r, s in edges]
+    def restore_edges():
+        for (r, s), value in zip(edges, initial_edges):
+            graph.update_tau(r, s, value)
+    restore = tau_restorer(graph)
+
+    def graph_init():
+        AntGraph(instance.name, num_ants, instance.num_nodes, instance.delta_mat, carbon_mats[0], scaled_mats[0], instance.clusters_mat,
+                 vectorized=vectorized, symmetric=symmetric).positions
+
+    found = []
+    if path is not None:
+        found.append(('parse_instance', lambda: parse_instance(path), None))
+    found += [
+        ('emission_matrices', lambda: build_emission_matrices(instance.delta_mat, rng, AntGTSP.scalar, vehicle_types=(1,)), None),
+        ('graph_init', graph_init, None),
+        ('reset_tau', graph.reset_tau, None),
+        ('state_transition_rule', state_transition_rule, new_ant),
+        ('local_updating_rule', local_updating_rule, restore_edges),
+        ('global_updating_rule', colony.global_updating_rule, restore),
+        ('tour_costs', lambda: batch_tour_costs(graph.delta_mat, tours), None),
+        ('create_image', lambda: graph.create_image('F', colony.best_path_vec, colony.best_path_cost, io.BytesIO()), None),
+    ]
+    if vectorized:
+        batch = BatchAntColony(graph, num_ants, num_iterations, seed=seed)
+        batch.iter_counter = 0
+        found.append(('batch_iteration', batch.iteration, restore))
+    return found, restore
+
+# {source: {kernel: {num_nodes: seconds}}} for the synthetic and real instances
+def run_kernels(sizes=SIZES, real_instances=REAL_INSTANCES, instance_dir=INSTANCE_DIR, mode='vectorized', min_time=0.2, repeat=3,
+                only=None):
+    instances = [('synthetic', synthetic_instance(num_nodes), None) for num_nodes in sizes]
+    for name in real_instances:
+        path = os.path.join(instance_dir, name + '.txt')
+        instances.append(('real', parse_instance(path), path))
+
+    results = {'synthetic': {}, 'real': {}}
+    for source, instance, path in instances:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            found, restore = kernels(instance, path, mode)
+        for name, kernel, setup in found:
+            if only is not None and name not in only:
+                continue
+            restore()
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    seconds = time_kernel(kernel, min_time, repeat, setup)
+            except ImportError as e:
+                # sklearn and matplotlib are optional
+                print ("%s skipped: %s" % (name, e))
+                continue
+            results[source].setdefault(name, {})[str(instance.num_nodes)] = seconds
+            print ("%-9s %-22s %5d nodes %12.6f ms" % (source, name, instance.num_nodes, seconds * 1000))
+    return results
+
+# slope of log(time) over log(nodes), per source and kernel
+def scaling_exponents(results):
+    exponents = {}
+    for source, timings in results.items():
+        for name, by_size in timings.items():
+            if len(by_size) < 2:
+                continue
+            sizes = np.array([float(size) for size in by_size])
+            seconds = np.array(list(by_size.values()))
+            exponents.setdefault(source, {})[name] = float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+    return exponents
+
+# (source, kernel, num_nodes, ratio) of every timing slower than the baseline by more than tolerance
+def regressions(results, baseline, tolerance=TOLERANCE):
+    found = []
+    for source, timings in results.items():
+        for name, by_size in timings.items():
+            for size, seconds in by_size.items():
+                before = baseline.get(source, {}).get(name, {}).get(size)
+                if before and seconds / before > 1 + tolerance:
+                    found.append((source, name, int(size), seconds / before))
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the solver kernels and compare against a stored baseline.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(SIZES))
+    parser.add_argument('--instances', nargs='*', default=list(REAL_INSTANCES))
+    parser.add_argument('--instance-dir', default=INSTANCE_DIR)
+    parser.add_argument('--mode', default='vectorized', choices=MODES)
+    parser.add_argument('--kernels', nargs='*', default=None, help='time only these kernels')
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = run_kernels(args.sizes, args.instances, args.instance_dir, args.mode, args.min_time, args.repeat, args.kernels)
+    exponents = scaling_exponents(results)
+    print ("\nScaling exponents (time ~ nodes^k)")
+    for source, by_kernel in exponents.items():
+        for name, exponent in sorted(by_kernel.items()):
+            print ("%-9s %-22s %5.2f" % (source, name, exponent))
+
+    report = {'mode': args.mode, 'timings': results, 'exponents': exponents}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print ("\nBaseline saved to %s" % (args.baseline,))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('mode') != args.mode:
+            print ("\nBaseline was taken in %s mode, not compared" % (baseline.get('mode'),))
+            sys.exit(0)
+        slower = regressions(results, baseline['timings'], args.tolerance)
+        print ("\n%s regressions against %s" % (len(slower), args.baseline))
+        for source, name, size, ratio in slower:
+            print ("%-9s %-22s %5d nodes %5.2fx slower" % (source, name, size, ratio))
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,137 @@
+import numpy as np
+
+# Symmetric n x n matrix stored once per pair: the lower triangle (diagonal
+# included) packed row by row into one 1-D array, cell (r, s) with r >= s at
+# r * (r + 1) / 2 + s. Writing (r, s) therefore also writes (s, r), and a node
+# added at the end only appends its row, so the storage can grow in place.
+#
+# Indexing follows numpy for the forms the solver uses:
+#   m[r, s]         r and s ints or (broadcastable) integer arrays
+#   m[rows]         full rows, rows an int or an integer array
+#   m[rows, :]      same, and m[:, cols] for columns
+#   m[...] = other  copy another PackedSymmetric
+# np.array(m) gives the dense matrix.
+class PackedSymmetric:
+    def __init__(self, num_nodes, data=None, dtype=np.float64):
+        self.num_nodes = num_nodes
+        if data is None:
+            data = np.zeros(packed_size(num_nodes), dtype=dtype)
+        if len(data) < packed_size(num_nodes):
+            raise Exception("packed data too short for %s nodes" % (num_nodes,))
+        self.buffer = data
+        self.data = data[:packed_size(num_nodes)]
+        self.build_row_start()
+
+    # row_start[r] = r * (r + 1) / 2, in int32 while the packed size allows it
+    # since the index arithmetic runs on every row access
+    def build_row_start(self):
+        self.index_dtype = np.int32 if packed_size(self.num_nodes) < np.iinfo(np.int32).max else np.int64
+        nodes = np.arange(self.num_nodes, dtype=np.int64)
+        self.row_start = (nodes * (nodes + 1) // 2).astype(self.index_dtype)
+
+    # the lower triangle of a (symmetric) dense matrix
+    @classmethod
+    def from_matrix(cls, matrix, dtype=np.float64):
+        matrix = np.asarray(matrix)
+        num_nodes = len(matrix)
+        r, s = np.tril_indices(num_nodes)
+        return cls(num_nodes, np.ascontiguousarray(matrix[r, s], dtype=dtype))
+
+    @property
+    def shape(self):
+        return (self.num_nodes, self.num_nodes)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    ndim = 2
+
+    def __len__(self):
+        return self.num_nodes
+
+    def index(self, r, s):
+        r = np.asarray(r, dtype=self.index_dtype)
+        s = np.asarray(s, dtype=self.index_dtype)
+        return self.row_start[np.maximum(r, s)] + np.minimum(r, s)
+
+    # (r, s) index arrays of a key, rows-only keys select whole rows
+    def key_index(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        r, s = key
+        nodes = np.arange(self.num_nodes, dtype=self.index_dtype)
+        if isinstance(s, slice):
+            s = nodes[s]
+            r = np.asarray(r, dtype=self.index_dtype)
+            return self.index(r[..., np.newaxis], s)
+        if isinstance(r, slice):
+            r = nodes[r]
+            s = np.asarray(s, dtype=self.index_dtype)
+            if s.ndim == 0:
+                return self.index(r, s)
+            return self.index(r[:, np.newaxis], s)
+        return self.index(r, s)
+
+    # take is markedly faster than fancy indexing for the row gathers
+    def __getitem__(self, key):
+        return self.data.take(self.key_index(key))
+
+    def __setitem__(self, key, value):
+        if key is Ellipsis:
+            if isinstance(value, PackedSymmetric):
+                value = value.data
+            self.data[...] = value
+            return
+        self.data[self.key_index(key)] = value
+
+    def __imul__(self, value):
+        self.data *= value
+        return self
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.empty(self.shape, dtype=self.dtype if dtype is None else dtype)
+        r, s = np.tril_indices(self.num_nodes)
+        dense[r, s] = self.data
+        dense[s, r] = self.data
+        return dense
+
+    def fill(self, value):
+        self.data.fill(value)
+
+    def copy(self):
+        return PackedSymmetric(self.num_nodes, self.data.copy())
+
+    def astype(self, dtype):
+        return PackedSymmetric(self.num_nodes, self.data.astype(dtype))
+
+    # mean and max over all n x n cells, the off-diagonal cells count twice
+    def mean(self, axis=None, dtype=None, out=None):
+        diagonal = self.data[self.index(np.arange(self.num_nodes), np.arange(self.num_nodes))]
+        return (2 * self.data.sum(dtype=np.float64) - diagonal.sum(dtype=np.float64)) / (self.num_nodes * self.num_nodes)
+
+    def max(self, axis=None, out=None):
+        return self.data.max()
+
+    def min(self, axis=None, out=None):
+        return self.data.min()
+
+    # grow to num_nodes, the new rows start at zero; the buffer grows
+    # geometrically so that adding a node is O(n) amortized
+    def resize(self, num_nodes):
+        size = packed_size(num_nodes)
+        if size > len(self.buffer):
+            capacity = max(size, len(self.buffer) + len(self.buffer) // 2)
+            buffer = np.zeros(capacity, dtype=self.dtype)
+            buffer[:len(self.data)] = self.data
+            self.buffer = buffer
+        self.num_nodes = num_nodes
+        self.data = self.buffer[:size]
+        self.build_row_start()
+
+def packed_size(num_nodes):
+    return num_nodes * (num_nodes + 1) // 2
@@ -0,0 +1,38 @@
+from collections import namedtuple
+import numpy as np
+
+# Final pheromone matrix and best tour of a run, saved so that a later run on
+# the same (or a slightly changed) network can start from them instead of the
+# uniform tau0. Stored with np.savez_compressed, tau as float32: pheromone
+# values only steer the ants' choices, so single precision loses nothing that
+# matters and halves the file.
+
+PheromoneState = namedtuple('PheromoneState', ['instance_name', 'tau_mat', 'best_path_vec', 'best_path_cost'])
+
+# np.savez_compressed appends .npz to a path without it, so both save_state
+# and load_state use the path with the suffix
+def npz_path(path):
+    path = str(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+def save_state(path, instance_name, tau_mat, best_path_vec, best_path_cost):
+    np.savez_compressed(npz_path(path),
+                        instance_name=np.array(instance_name),
+                        tau_mat=np.asarray(tau_mat, dtype=np.float32),
+                        best_path_vec=np.asarray(best_path_vec, dtype=np.int32),
+                        best_path_cost=np.array(best_path_cost, dtype=np.float64))
+
+def save_colony_state(path, colony):
+    save_state(path, colony.graph.instance_name, colony.graph.tau_mat, colony.best_path_vec, colony.best_path_cost)
+
+def load_state(path, num_nodes=None):
+    path = npz_path(path)
+    with np.load(path) as data:
+        state = PheromoneState(str(data['instance_name']), data['tau_mat'].astype(np.float64), data['best_path_vec'].tolist(),
+                               float(data['best_path_cost']))
+
+    if state.tau_mat.ndim != 2 or state.tau_mat.shape[0] != state.tau_mat.shape[1]:
+        raise Exception("pheromone state is not a square matrix: " + path)
+    if num_nodes is not None and state.tau_mat.shape[0] != num_nodes:
+        raise Exception("pheromone state has %s nodes, the instance has %s" % (state.tau_mat.shape[0], num_nodes))
+    return state
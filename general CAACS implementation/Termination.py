@@ -0,0 +1,123 @@
+import time
+import numpy as np
+
+# Termination rules for AntColony.start / BatchAntColony.start. A colony calls
+# reset(colony) before its first iteration and check(colony) after every
+# global update; check returns a string describing why the run should stop,
+# or None to keep going. The colony stores that string in stop_reason.
+
+# stop after window iterations without a better best_path_cost
+class Stagnation:
+    def __init__(self, window):
+        self.window = max(1, int(window))
+
+    def reset(self, colony):
+        self.best_path_cost = colony.best_path_cost
+        self.no_change_count = 0
+
+    def check(self, colony):
+        if colony.best_path_cost < self.best_path_cost:
+            self.best_path_cost = colony.best_path_cost
+            self.no_change_count = 0
+        else:
+            self.no_change_count += 1
+
+        if self.no_change_count >= self.window:
+            return "no improvement in %s iterations" % (self.window,)
+        return None
+
+# stop once the wall-clock budget (in seconds) is used up, counted from the
+# colony's start_time
+class TimeBudget:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def reset(self, colony):
+        self.start_time = colony.start_time
+
+    def check(self, colony):
+        if time.time() - self.start_time >= self.seconds:
+            return "time budget of %ss used" % (self.seconds,)
+        return None
+
+# stop when the best cost is within tolerance (a fraction) of a target cost,
+# e.g. the reference cost from the empirical solutions
+class TargetCost:
+    def __init__(self, target_cost, tolerance=0.0):
+        self.target_cost = target_cost
+        self.tolerance = tolerance
+
+    def reset(self, colony):
+        pass
+
+    def check(self, colony):
+        if colony.best_path_cost <= self.target_cost * (1 + self.tolerance):
+            return "target cost %s reached" % (self.target_cost,)
+        return None
+
+# stop when the pheromone matrix has converged, measured either as the average
+# lambda-branching factor (number of edges per node whose tau is above
+# tau_min + Lambda * (tau_max - tau_min) in that node's row) or as the average
+# entropy of the normalized rows (in nats). Checked every `every` iterations
+# since both measures read the whole matrix.
+class PheromoneConvergence:
+    def __init__(self, threshold=2.0, measure='branching', Lambda=0.05, every=1):
+        if measure not in ('branching', 'entropy'):
+            raise Exception("unknown convergence measure: " + str(measure))
+        self.threshold = threshold
+        self.measure = measure
+        self.Lambda = Lambda
+        self.every = max(1, int(every))
+
+    def reset(self, colony):
+        self.counter = 0
+
+    def check(self, colony):
+        self.counter += 1
+        if self.counter % self.every != 0:
+            return None
+
+        value = self.value(colony.graph)
+        if value <= self.threshold:
+            return "pheromone converged (%s %.3f <= %s)" % (self.measure, value, self.threshold)
+        return None
+
+    def value(self, graph):
+        tau = np.array(graph.tau_mat, dtype=np.float64)
+        # ignore the diagonal, it is never used by an ant
+        np.fill_diagonal(tau, np.nan)
+
+        if self.measure == 'branching':
+            tau_min = np.nanmin(tau, axis=1)
+            tau_max = np.nanmax(tau, axis=1)
+            cutoff = tau_min + self.Lambda * (tau_max - tau_min)
+            return float(np.mean(np.sum(tau >= cutoff[:, np.newaxis], axis=1)))
+
+        tau = np.nan_to_num(tau, nan=0.0)
+        p = tau / tau.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.sum(np.where(p > 0, p * np.log(p), 0.0), axis=1)
+        return float(np.mean(entropy))
+
+# stop as soon as any of the rules says so
+class AnyOf:
+    def __init__(self, *rules):
+        self.rules = rules
+
+    def reset(self, colony):
+        for rule in self.rules:
+            rule.reset(colony)
+
+    def check(self, colony):
+        reason = None
+        # every rule sees every iteration, so stateful rules stay in sync
+        for rule in self.rules:
+            rule_reason = rule.check(colony)
+            if reason is None:
+                reason = rule_reason
+        return reason
+
+# the stopping criteria the colonies used before, a stagnation window of a
+# fifth of the nodes
+def default_termination(num_nodes):
+    return Stagnation(max(1, num_nodes // 5))
@@ -0,0 +1,113 @@
+import numpy as np
+from PackedMatrix import PackedSymmetric
+
+# Cost and carbon of closed tours, one shared path for the graph, the pictures,
+# local search and the benchmarks. mat is any edge matrix of the graph
+# (delta_mat, carbon_mat or an objective matrix): ndarray and PackedSymmetric
+# matrices are read with one fancy-indexing gather mat[tour, roll(tour)] and
+# summed in float64, the nested lists of the list mode with a plain loop.
+#
+# The *_delta functions give the change of a tour's value for one move in
+# O(1), so calling them with delta_mat and with carbon_mat gives the cost and
+# the carbon change of the move. 2-opt needs the tour's prefix sums
+# (prefix_sums), because reversing a segment of an asymmetric tour turns the
+# direction of all its edges.
+
+def is_array(mat):
+    return isinstance(mat, (np.ndarray, PackedSymmetric))
+
+# value of one closed tour
+def tour_cost(mat, path_vec):
+    if is_array(mat):
+        path = np.asarray(path_vec, dtype=np.int64)
+        return float(np.sum(mat[path, np.roll(path, -1)], dtype=np.float64))
+    total = 0
+    for i in range(len(path_vec)):
+        total += mat[path_vec[i]][path_vec[(i + 1) % len(path_vec)]]
+    return total
+
+# values of a batch of closed tours of equal length, paths is (tours x length)
+def batch_tour_costs(mat, paths):
+    paths = np.asarray(paths, dtype=np.int64)
+    if not is_array(mat):
+        return np.array([tour_cost(mat, path) for path in paths.tolist()], dtype=np.float64)
+    return np.sum(mat[paths, np.roll(paths, -1, axis=1)], axis=1, dtype=np.float64)
+
+# (cost, carbon) of a tour on a graph
+def tour_metrics(graph, path_vec):
+    return tour_cost(graph.delta_mat, path_vec), tour_cost(graph.carbon_mat, path_vec)
+
+# in float64, differences of compact unsigned distances would wrap around
+def edge(mat, r, s):
+    if is_array(mat):
+        value = mat[r, s]
+        return value.astype(np.float64) if isinstance(value, np.ndarray) else float(value)
+    return mat[r][s]
+
+# float64 block of mat, rows x cols
+def block(mat, rows, cols):
+    return np.asarray(mat[np.ix_(rows, cols)], dtype=np.float64)
+
+def node_at(tour, i):
+    return tour[i % len(tour)]
+
+# forward[i] is the value of the edges before position i, backward[i] the
+# same with every edge reversed; both have length + 1 entries
+def prefix_sums(mat, tour):
+    path = np.asarray(tour, dtype=np.int64)
+    following = np.roll(path, -1)
+    if not is_array(mat):
+        mat = np.asarray(mat)
+    forward = np.concatenate(([0.0], np.cumsum(mat[path, following], dtype=np.float64)))
+    backward = np.concatenate(([0.0], np.cumsum(mat[following, path], dtype=np.float64)))
+    return forward, backward
+
+# value of the edges inside the circular segment from position p to q
+def segment_sum(sums, p, q):
+    if p <= q:
+        return sums[q] - sums[p]
+    return sums[-1] - sums[p] + sums[q]
+
+# reversing the circular segment of length positions starting at p
+def two_opt_delta(mat, tour, p, length, forward, backward):
+    p = p % len(tour)
+    q = (p + length - 1) % len(tour)
+    a, first, last, b = node_at(tour, p - 1), tour[p], tour[q], node_at(tour, q + 1)
+    inside = segment_sum(backward, p, q) - segment_sum(forward, p, q)
+    return edge(mat, a, last) + edge(mat, first, b) - edge(mat, a, first) - edge(mat, last, b) + inside
+
+# exchanging the nodes at positions i and j
+def swap_delta(mat, tour, i, j):
+    size = len(tour)
+    i, j = i % size, j % size
+    if i == j:
+        return 0.0
+
+    def swapped(k):
+        k = k % size
+        return tour[j] if k == i else tour[i] if k == j else tour[k]
+
+    # the (at most four) edges that start at i - 1, i, j - 1 or j
+    starts = set(k % size for k in (i - 1, i, j - 1, j))
+    old = sum(edge(mat, node_at(tour, k), node_at(tour, k + 1)) for k in starts)
+    new = sum(edge(mat, swapped(k), swapped(k + 1)) for k in starts)
+    return new - old
+
+# replacing the node at position i with node (of the same cluster); node can
+# also be an array of candidates, giving one delta per candidate
+def reselect_delta(mat, tour, i, node):
+    prev_node, current, next_node = node_at(tour, i - 1), node_at(tour, i), node_at(tour, i + 1)
+    if not is_array(mat) and not np.isscalar(node):
+        mat = np.asarray(mat)
+    old = edge(mat, prev_node, current) + edge(mat, current, next_node)
+    return edge(mat, prev_node, node) + edge(mat, node, next_node) - old
+
+# moving the segment of length positions starting at i after position j
+# (j outside the segment and not its predecessor)
+def move_segment_delta(mat, tour, i, length, j):
+    first, last = node_at(tour, i), node_at(tour, i + length - 1)
+    prev_node, next_node = node_at(tour, i - 1), node_at(tour, i + length)
+    after, before = node_at(tour, j), node_at(tour, j + 1)
+    removed = edge(mat, prev_node, first) + edge(mat, last, next_node) - edge(mat, prev_node, next_node)
+    added = edge(mat, after, first) + edge(mat, last, before) - edge(mat, after, before)
+    return added - removed